@@ -1,123 +1,217 @@
-from lib import Variable, Var, Assn
-from heuristics import choose_splitting_var
+from lib import Assn, Lit
+from heuristics import FirstUnassigned, AlwaysTrue
+from stats import Stats
 import logging
 
+# Local aliases, these are compared against on the hot path
+TRUE = Assn.TRUE
+FALSE = Assn.FALSE
+UNKNOWN = Assn.UNKNOWN
+
 class Assignment():
     '''
     Handles assignment info of variables
     '''
 
-    def __init__(self, variables, sat):
+    def __init__(self, sat, heuristic=None, polarity=None, stats=None):
         '''
-        assignment_stack: stack of our assignments comprising
-                          (assignment, variable) pairs, allowing backtracking easily.
-                          Head of stack contains our current assignment.
-        propagation_queue: Queue of variables that have been set to false
+        stats:      Stats to count propagations, backtracks and decision levels in
+        heuristic:  BranchingHeuristic used to pick splitting variables, it is kept
+                    informed of every unassignment. Defaults to FirstUnassigned.
+        polarity:   PolarityHeuristic used to pick the value of splitting variables,
+                    also informed of every unassignment. Defaults to AlwaysTrue.
+        values:     flat array of assignment values, indexed by literal, so both x
+                    and NOT x have their own entry and a lookup needs no negation
+        trail:      every literal that has been made true, in the order they were
+                    assigned. Literals of a decision level are contiguous.
+        trail_lim:  trail_lim[i] is the offset in the trail where decision level i + 1
+                    starts, so trail[trail_lim[i]] is the decision literal of that level.
+                    Backtracking only has to undo the literals after this offset.
+        qhead:      index of the next literal on the trail whose negation still has to
+                    be processed by unit propagation. Everything in trail[qhead:] acts
+                    as our propagation queue.
         '''
         self.sat = sat # For heuristics
-        assignments = {}
-        for var_ in variables.values():
-            assignments[var_] = Assn.UNKNOWN
-
-        self.assignment_stack = [
-            (assignments, None)
-        ]
+        self.num_vars = sat.num_vars
+        if heuristic is None:
+            heuristic = FirstUnassigned(sat.num_vars, sat)
+        self.heuristic = heuristic
+        if polarity is None:
+            polarity = AlwaysTrue(sat.num_vars, sat)
+        self.polarity = polarity
+        self.values = bytearray([UNKNOWN]) * (2 * sat.num_vars + 2)
+        # Decision level each variable was assigned at, and the cref of the clause
+        # that forced it (-1 for decisions). Only meaningful while it is assigned.
+        self.levels = [0] * (sat.num_vars + 1)
+        self.reasons = [-1] * (sat.num_vars + 1)
+        # cref of the clause found to be conflicting by the last failed unit propagation
+        self.conflict = -1
 
-        self.propagation_queue = []
+        self.trail = []
+        self.trail_lim = []
+        self.qhead = 0
+        self.stats = Stats() if stats is None else stats
+        # Set of crefs visited by propagation, only tracked when it is a set.
+        # Used to check invariants incrementally.
+        self.touched = None
+        # Debug messages on the hot path are only built when they will be shown.
+        # Checked once up front, as even a disabled logging call has a cost.
+        self.debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        # Optional tracer.Tracer receiving structured events
+        self.tracer = None
 
     def __repr__(self):
-        s = "===SAT Assignments===\n"
-        for variable, assn in self.assignment_stack[-1][0].items():
-            s += repr(variable) + ": " + Assn.toStr(assn) + "\n"
-        return s
+        s = ["===SAT Assignments==="]
+        for label in range(1, self.num_vars + 1):
+            s.append("x" + str(label) + ": " + Assn.toStr(self.values[2 * label]))
+        return "\n".join(s) + "\n"
+
+    def decision_level(self):
+        '''
+        Returns the current decision level, 0 being the base level
+        '''
+        return len(self.trail_lim)
+
+    def decision_lit(self):
+        '''
+        Returns the literal that was decided on at the current decision level
+        '''
+        assert len(self.trail_lim) > 0, "No decision at base layer"
+        return self.trail[self.trail_lim[-1]]
+
+    def new_var(self):
+        '''
+        Makes room for a variable just added to the formula, see SAT.new_var
+        '''
+        self.num_vars += 1
+        self.values.append(UNKNOWN)
+        self.values.append(UNKNOWN)
+        self.levels.append(0)
+        self.reasons.append(-1)
+        self.heuristic.new_var()
+        self.polarity.new_var()
+
+    def _enqueue(self, lit, reason=-1):
+        '''
+        Records the assignment on the trail. The literal that just became false
+        is then picked up by unit propagation.
+        '''
+        self.values[lit] = TRUE
+        self.values[lit ^ 1] = FALSE
+        self.levels[lit >> 1] = len(self.trail_lim)
+        self.reasons[lit >> 1] = reason
+        self.trail.append(lit)
+        if self.debug:
+            logging.debug(f"Adding {Lit.toStr(lit ^ 1)} to propagation queue")
 
-    def create_decision_level(self, variable: Variable, assn: Assn):
+    def create_decision_level(self, lit):
         '''
         Called when we are making a choice on an assignment that is not forced on us
-        This creates a new assignment level off the old one
+        This creates a new assignment level off the old one, with lit made true
         '''
-        assert assn != Assn.UNKNOWN, "Cannot assign unknown"
-        assert self.assignment_stack[-1][0][variable] == Assn.UNKNOWN, "Cannot assign to assigned variable"
+        assert self.values[lit] == UNKNOWN, "Cannot assign to assigned variable"
 
-        new_assignment = self.assignment_stack[-1][0].copy()
-        new_assignment[variable] = assn
-        self.assignment_stack.append((new_assignment, variable))
+        self.trail_lim.append(len(self.trail))
+        if len(self.trail_lim) > self.stats.max_level:
+            self.stats.max_level = len(self.trail_lim)
+        self._enqueue(lit)
+        if self.tracer is not None:
+            self.tracer.decide(lit, len(self.trail_lim))
 
-        # Update propagation queue
-        if assn == Assn.TRUE:
-            self.propagation_queue.append(variable.getNeg())
-            logging.debug(f"Adding {variable.getNeg()} to propagation queue")
-        else:
-            self.propagation_queue.append(variable.getPos())
-            logging.debug(f"Adding {variable.getPos()} to propagation queue")
+    def create_empty_level(self):
+        '''
+        Opens a decision level without deciding anything, used for assumptions
+        that are already true so that level i still belongs to assumption i
+        '''
+        self.trail_lim.append(len(self.trail))
 
     def backtrack(self):
         '''
         Backtracks and restores assignment from previous level.
-        We also return the variable that was used for the assignment at this level.
+        We also return the literal that was decided on at this level.
         '''
-        assert len(self.assignment_stack) > 1, "Cannot backtrack from base layer"
-        (_, var_) = self.assignment_stack.pop()
-        return var_
+        assert len(self.trail_lim) > 0, "Cannot backtrack from base layer"
+        lit = self.decision_lit()
+        self.backjump(len(self.trail_lim) - 1)
+        return lit
 
-    def assign(self, variable: Variable, assn: Assn):
+    def backjump(self, level):
         '''
-        Performs an assignment that is forced on us, applied on the current
-        decision level
+        Undoes every assignment made above the given decision level, possibly
+        skipping over several levels at once
         '''
-        assert assn != Assn.UNKNOWN, "Cannot assign unknown"
-        assert variable in self.assignment_stack[-1][0], "Use variable not var!"
-        self.assignment_stack[-1][0][variable] = assn
+        if level >= len(self.trail_lim):
+            return
+        lim = self.trail_lim[level]
+        values = self.values
+        polarity = self.polarity
+        heuristic = self.heuristic
+        for lit in self.trail[lim:]:
+            var_ = lit >> 1
+            polarity.unassigned(var_, FALSE if lit & 1 else TRUE)
+            values[lit] = UNKNOWN
+            values[lit ^ 1] = UNKNOWN
+            heuristic.unassigned(var_)
+        del self.trail[lim:]
+        del self.trail_lim[level:]
+        self.stats.backtracks += 1
+        self.qhead = min(self.qhead, lim)
+        if self.tracer is not None:
+            self.tracer.backtrack(level)
 
-        logging.debug(f"Assigning {variable} to {Assn.toStr(assn)}")
+    def assign(self, lit, reason=-1):
+        '''
+        Performs an assignment that is forced on us, applied on the current
+        decision level, making lit true
 
-        # Update propagation queue
-        if assn == Assn.TRUE:
-            logging.debug(f"Adding {variable.getNeg()} to propagation queue")
-            self.propagation_queue.append(variable.getNeg())
-        else:
-            logging.debug(f"Adding {variable.getPos()} to propagation queue")
-            self.propagation_queue.append(variable.getPos())
+        reason: cref of the clause that became unit and forced this assignment, if any
+        '''
+        assert self.values[lit] == UNKNOWN, "Cannot assign to assigned variable"
+        if self.debug:
+            logging.debug(f"Assigning {Lit.toStr(lit)} to T")
+        self._enqueue(lit, reason)
+        if self.tracer is not None:
+            self.tracer.assign(lit, len(self.trail_lim),
+                               self.sat.clauses[reason] if reason >= 0 else None)
 
-        logging.debug(f"Propagation queue: {self.propagation_queue}")
+    def assign_units(self):
+        '''
+        Assigns the unit clauses of the formula at the base level.
+        Returns False if two of them contradict each other, else True.
+        '''
+        for lit in self.sat.units:
+            if self.values[lit] == FALSE:
+                return False
+            if self.values[lit] == UNKNOWN:
+                self.assign(lit)
+        return True
 
     def num_unassigned(self):
         '''
         Returns number of unassigned variables at the current level
         '''
-        num_unassigned = 0
-        for assn in self.assignment_stack[-1][0].values():
-            if assn == Assn.UNKNOWN:
-                num_unassigned += 1
-
-        return num_unassigned
+        return self.num_vars - len(self.trail)
 
     def get_unassigned_var(self):
         '''
-        Returns the first unassigned variable that it finds
-        Future extension: add better heuristics, allow users to specify their own
+        Returns the unassigned variable chosen by our branching heuristic
         '''
-        try:
-            var_ = choose_splitting_var(self.assignment_stack[-1][0], self.sat)
-            assert self.get_assignment_val(var_.getPos()) == Assn.UNKNOWN, \
-                "choose_splitting_var must return an unassigned var"
-            return var_
-        except NotImplementedError:
-            # Default: find the first unassigned var
-            for var_, assn in self.assignment_stack[-1][0].items():
-                if assn == Assn.UNKNOWN:
-                    return var_
-                
+        var_ = self.heuristic.pick(self)
+        assert self.values[2 * var_] == UNKNOWN, \
+            "Heuristic must return an unassigned var"
+        return var_
 
-    def get_assignment_val(self, var_: Var):
+    def get_unassigned_lit(self, var_):
         '''
-        Gets assignment value of a variable 
-        If it is NOT x, then answer is negated
+        Returns the literal of var_ that our polarity heuristic wants to try first
         '''
-        var_base_val = self.assignment_stack[-1][0][var_.var]
-        if var_.isNeg():
-            return Assn.neg(var_base_val)
-        return var_base_val
+        return Lit.make(var_, self.polarity.choose(var_, self) == FALSE)
+
+    def get_assignment_val(self, lit):
+        '''
+        Gets assignment value of a literal
+        '''
+        return self.values[lit]
 
     def unit_propagation(self):
         '''
@@ -126,32 +220,184 @@ class Assignment():
         Returns negative number if backtracking is necessary,
         else 0 on success
         '''
-        while len(self.propagation_queue) > 0:
-            var_ = self.propagation_queue.pop()
-            logging.debug("Processing propagation queue: " + repr(var_))
-            logging.debug(var_.watchingClauses())
+        values = self.values
+        trail = self.trail
+        clauses = self.sat.clauses
+        watches = self.sat.watches
+        # Counted locally, and added to the stats once at the end
+        start = self.qhead
+        visits = 0
+        while self.qhead < len(trail):
+            false_lit = trail[self.qhead] ^ 1
+            self.qhead += 1
+            if self.debug:
+                logging.debug("Processing propagation queue: " + Lit.toStr(false_lit))
+
+            # Compact the watch list in place: clauses that keep watching
+            # false_lit are copied down to position j, the others are dropped
+            ws = watches[false_lit]
+            if self.touched is not None:
+                self.touched.update(ws)
+            i = j = 0
+            n = len(ws)
+            visits += n
+            while i < n:
+                cref = ws[i]
+                i += 1
+                clause = clauses[cref]
+                lits = clause.lits
+                if self.debug:
+                    logging.debug("Dealing with clause: " + clause.pp(self))
+
+                # Make sure the false literal is lits[1]
+                if lits[0] == false_lit:
+                    lits[0] = lits[1]
+                    lits[1] = false_lit
 
-            # Make a copy, as we are modifying this on the fly
-            clauses = var_.watchingClauses().copy()
-            for clause in clauses:
                 # If the clause is watching some other
                 # literal that is true, then we are fine
-                logging.debug("Dealing with clause: " + clause.pp(self))
-                if self.get_assignment_val(var_) != Assn.FALSE:
-                    logging.debug(
-                        "Current assignment no longer cause conflict")
+                first = lits[0]
+                if values[first] == TRUE:
+                    ws[j] = cref
+                    j += 1
                     continue
 
-                if clause.is_watching_true(self):
-                    logging.debug("Clause already satisfied")
+                # If not, we need to make the clause watch something else that is not False
+                for k in range(2, len(lits)):
+                    if values[lits[k]] != FALSE:
+                        lits[1] = lits[k]
+                        lits[k] = false_lit
+                        watches[lits[1]].append(cref)
+                        break
+                else:
+                    ws[j] = cref
+                    j += 1
+                    if values[first] == FALSE:
+                        # Every literal is false, need to backtrack
+                        if self.debug:
+                            logging.debug(
+                                "Could not watch anything else, need to backtrack!")
+                        if self.tracer is not None:
+                            self.tracer.conflict(clause, len(self.trail_lim))
+                        self.conflict = cref
+                        ws[j:] = ws[i:n]
+                        self.stats.propagations += self.qhead - start
+                        self.stats.watch_visits += visits - (n - i)
+                        return -1
+
+                    # Else we force it to the value that makes it true
+                    self.assign(first, cref)
+                if self.debug:
+                    logging.debug("New watchlist: " + clause.pp(self))
+            del ws[j:]
+        self.stats.propagations += self.qhead - start
+        self.stats.watch_visits += visits
+        return 0
+
+    def locked(self, cref):
+        '''
+        Whether the clause is the reason of a current assignment, so it cannot
+        be deleted. The literal a clause forced is always its lits[0].
+        '''
+        lit = self.sat.clauses[cref].lits[0]
+        return self.values[lit] == TRUE and self.reasons[lit >> 1] == cref
+
+    def compute_lbd(self, lits):
+        '''
+        Returns the literal block distance of a clause, the number of distinct
+        decision levels among its literals. Lower is better, a clause with LBD 2
+        links a single literal to one other decision level ("glue clause").
+        '''
+        levels = self.levels
+        return len({levels[lit >> 1] for lit in lits})
+
+    def analyze_final(self, lit):
+        '''
+        Called when the assumption lit is already false. Returns the assumptions
+        that forced it false, lit included: while assumptions are being decided,
+        every decision is an assumption.
+        '''
+        core = [lit]
+        levels = self.levels
+        if levels[lit >> 1] == 0:
+            return core
+        seen = {lit >> 1}
+        for idx in range(len(self.trail) - 1, self.trail_lim[0] - 1, -1):
+            q = self.trail[idx]
+            if q >> 1 not in seen:
+                continue
+            reason = self.reasons[q >> 1]
+            if reason < 0:
+                core.append(q)
+            else:
+                for r in self.sat.clauses[reason].lits:
+                    if levels[r >> 1] > 0:
+                        seen.add(r >> 1)
+        return core
+
+    def analyze_conflict(self):
+        '''
+        First-UIP conflict analysis on the clause that failed the last unit propagation
+
+        Resolves the conflicting clause with the reasons of literals assigned at the
+        current decision level until a single such literal (the first unique
+        implication point) remains.
+
+        Returns (learnt, level) where learnt is the list of literals of the learnt
+        clause and level the decision level to backjump to. learnt[0] is the
+        literal that becomes asserting after the backjump, and learnt[1] (if any)
+        is a literal assigned at the backjump level, so both are safe to watch.
+        '''
+        assert self.conflict >= 0, "No conflict to analyze"
+        assert len(self.trail_lim) > 0, "Cannot analyze conflict at base layer"
+        current_level = len(self.trail_lim)
+        levels = self.levels
+        seen = set()
+        learnt = [-1]
+        counter = 0  # literals of the current level still to be resolved on
+        lit = -1
+        idx = len(self.trail) - 1
+        cref = self.conflict
+
+        while True:
+            clause = self.sat.clauses[cref]
+            if clause.learnt:
+                self.sat.bump_clause(clause)
+                # Clauses can get better as the search moves on, keep the best LBD
+                if clause.lbd > 2:
+                    clause.lbd = min(clause.lbd, self.compute_lbd(clause.lits))
+            for q in clause.lits:
+                var_ = q >> 1
+                if q == lit or var_ in seen or levels[var_] == 0:
                     continue
+                seen.add(var_)
+                self.heuristic.bump(var_)
+                if levels[var_] == current_level:
+                    counter += 1
+                else:
+                    learnt.append(q)
 
-                # If not, we need to make the clause watch something else that is not False
-                if clause.resolve_watch(var_, self) < 0:
-                    logging.debug(
-                        "Could not watch anything else, need to backtrack!")
-                    return -1  # need to backtrack
-                logging.debug("New watchlist: " + clause.pp(self))
-                assert clause.is_not_just_watching_false(
-                    self), "Should not be just watching false :" + clause.pp(self)
-        return 0
\ No newline at end of file
+            # Walk back along the trail to the next literal to resolve on
+            while self.trail[idx] >> 1 not in seen:
+                idx -= 1
+            lit = self.trail[idx]
+            idx -= 1
+            counter -= 1
+            if counter == 0:
+                break
+            cref = self.reasons[lit >> 1]
+            assert cref >= 0, "Only the UIP may be a decision"
+
+        learnt[0] = lit ^ 1
+
+        level = 0
+        if len(learnt) > 1:
+            max_idx = 1
+            for i in range(2, len(learnt)):
+                if levels[learnt[i] >> 1] > levels[learnt[max_idx] >> 1]:
+                    max_idx = i
+            learnt[1], learnt[max_idx] = learnt[max_idx], learnt[1]
+            level = levels[learnt[1] >> 1]
+
+        self.conflict = -1
+        return learnt, level
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+'''
+Solves many CNF files in parallel and writes one record per instance.
+
+Inputs can be files, directories (every file inside them is solved) or glob
+patterns, e.g. ./src/batch.py -j 8 --timeout 60 dat/sat dat/unsat
+
+Each record contains:
+    file:           path of the instance
+    result:         SAT, UNSAT, TIMEOUT or ERROR
+    time:           wall time spent loading and solving, in seconds
+    decisions:      number of decisions made
+    propagations:   number of literals processed by unit propagation
+    conflicts:      number of conflicts encountered
+    peak_rss_kb:    peak resident memory of the worker process so far. Workers
+                    are reused across instances, so this is a high-water mark;
+                    use --max-tasks-per-worker 1 for exact per-instance figures
+    verified:       for SAT only, whether the model satisfies the input formula
+    error:          the error message, for ERROR only
+'''
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import signal
+import logging
+import argparse
+import resource
+import multiprocessing
+import vectorized
+from loader import Loader
+from cache import FormulaCache
+from sat import SATSolver
+from heuristics import HEURISTICS, POLARITIES
+from restarts import RESTARTS
+from preprocess import Preprocessor, parse_passes
+from lib import UnsatException
+
+FIELDS = ["file", "result", "time", "decisions", "propagations", "conflicts",
+          "peak_rss_kb", "verified", "error"]
+
+
+class SolveTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise SolveTimeout()
+
+
+def expand_paths(paths):
+    '''
+    Expands directories and glob patterns into a sorted list of files
+    '''
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, f) for f in os.listdir(path)
+                                if os.path.isfile(os.path.join(path, f))))
+        elif os.path.exists(path):
+            files.append(path)
+        else:
+            matches = sorted(glob.glob(path))
+            if not matches:
+                logging.warning(f"No files match {path}")
+            files.extend(matches)
+    return files
+
+
+def solve_file(task):
+    '''
+    Solves a single CNF file, run inside a pool worker.
+    task is (location, mode, heuristic, polarity, restart, preprocess, timeout,
+    cache), timeout and cache, a FormulaCache directory, may be None.
+    '''
+    location, mode, heuristic, polarity, restart, preprocess, timeout, cache = task
+    record = {"file": location, "decisions": 0, "propagations": 0, "conflicts": 0}
+    sat_solver = None
+    start = time.perf_counter()
+    if timeout:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+    try:
+        try:
+            if timeout:
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            if cache:
+                original = FormulaCache(cache).load_file(location)
+            else:
+                original = Loader.load_file(location)
+            preprocessor = Preprocessor(original, preprocess)
+            sat_solver = SATSolver(preprocessor.run(), heuristic, polarity, restart=restart)
+            if sat_solver.solve(mode):
+                record["result"] = "SAT"
+                values = sat_solver.assignments.values
+                preprocessor.extend_model(values)
+                if vectorized.worthwhile(original):
+                    record["verified"] = vectorized.Formula(original).satisfied_by(values)
+                else:
+                    record["verified"] = original.satisfied_by(values)
+            else:
+                record["result"] = "UNSAT"
+            if timeout:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        except UnsatException:
+            record["result"] = "UNSAT"
+        except SolveTimeout:
+            record["result"] = "TIMEOUT"
+        except Exception as e:
+            record["result"] = "ERROR"
+            record["error"] = str(e)
+        finally:
+            if timeout:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    except SolveTimeout:
+        # The timer fired in one of the handlers above, before it was disarmed.
+        # It only fires once, so nothing can interrupt this handler.
+        record.setdefault("result", "TIMEOUT")
+
+    record["time"] = round(time.perf_counter() - start, 6)
+    if sat_solver is not None:
+        record["decisions"] = sat_solver.stats.decisions
+        record["propagations"] = sat_solver.stats.propagations
+        record["conflicts"] = sat_solver.stats.conflicts
+    record["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return record
+
+
+class JSONWriter():
+    '''
+    Writes records as JSON lines
+    '''
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, record):
+        self.out.write(json.dumps(record) + "\n")
+
+
+class CSVWriter():
+    '''
+    Writes records as CSV with a header row
+    '''
+    def __init__(self, out):
+        self.writer = csv.DictWriter(out, fieldnames=FIELDS)
+        self.writer.writeheader()
+
+    def write(self, record):
+        self.writer.writerow(record)
+
+
+WRITERS = {
+    "json": JSONWriter,
+    "csv": CSVWriter,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Solve CNF files in parallel and report per-instance results")
+    parser.add_argument("paths", nargs='+',
+                    help="CNF files, directories of CNF files, or glob patterns")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                    help="number of worker processes (default: number of cores)")
+    parser.add_argument("-t", "--timeout", type=float, default=None,
+                    help="per-instance time limit in seconds")
+    parser.add_argument("-f", "--format", choices=sorted(WRITERS), default="json",
+                    help="json writes one JSON object per line")
+    parser.add_argument("-o", "--output", default=None,
+                    help="file to write the records to (default: stdout)")
+    parser.add_argument("--max-tasks-per-worker", type=int, default=None,
+                    help="restart each worker after this many instances")
+    parser.add_argument("-m", "--mode", choices=["dpll", "cdcl"], default="dpll",
+                    help="search algorithm, see sat.py")
+    parser.add_argument("--heuristic", choices=sorted(HEURISTICS), default="vsids",
+                    help="branching heuristic used to choose the splitting variable")
+    parser.add_argument("--polarity", choices=sorted(POLARITIES), default="save",
+                    help="value to try first for the splitting variable")
+    parser.add_argument("--restart", choices=sorted(RESTARTS), default="luby",
+                    help="restart policy, only used by cdcl")
+    parser.add_argument("--preprocess", type=parse_passes, default="all", metavar="PASSES",
+                    help="preprocessing passes, see sat.py")
+    parser.add_argument("--cache", metavar="DIR", default=None,
+                    help="binary formula cache directory, see sat.py")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARN)
+
+    files = expand_paths(args.paths)
+    tasks = [(f, args.mode, args.heuristic, args.polarity, args.restart, args.preprocess,
+              args.timeout, args.cache) for f in files]
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    writer = WRITERS[args.format](out)
+    counts = {}
+    with multiprocessing.Pool(args.jobs, maxtasksperchild=args.max_tasks_per_worker) as pool:
+        for record in pool.imap_unordered(solve_file, tasks):
+            writer.write(record)
+            out.flush()
+            counts[record["result"]] = counts.get(record["result"], 0) + 1
+    if out is not sys.stdout:
+        out.close()
+
+    summary = ", ".join(f"{result}: {n}" for result, n in sorted(counts.items()))
+    print(f"Solved {len(files)} instances ({summary})", file=sys.stderr)
+    sys.exit(1 if "ERROR" in counts else 0)
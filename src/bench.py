@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+'''
+Benchmarks solver configurations over the test corpora and catches both wrong
+answers and performance regressions, e.g.
+
+    ./src/bench.py --save-baseline bench-baseline.json     # before a change
+    ./src/bench.py --baseline bench-baseline.json          # after it
+
+Every instance is solved under every configuration (see --config) with the
+batch.py workers, recording decisions, propagations, conflicts, time and peak
+memory. The expected answer comes from the path: instances in a directory
+named unsat, with a SATLIB name starting with uuf, or with "unsat" as a word
+of their name (small-unsat1.cnf) must be UNSAT. Likewise sat, uf and "sat"
+for SAT, with a model that satisfies the input formula. Other instances are
+only checked for errors and models that do not verify.
+
+When NumPy is installed, every instance is also checked for vectorized.Formula
+giving the same model verification and Jeroslow-Wang and MOM scores as the
+plain loops used for small formulas.
+
+With --baseline, the totals of each configuration and every instance are
+compared against a stored run. Anything that grew by more than the threshold
+is reported as a regression. The exit status is 1 on wrong answers, errors,
+unverified models or regressions.
+'''
+import os
+import re
+import sys
+import json
+import random
+import logging
+import argparse
+import multiprocessing
+import vectorized
+from batch import expand_paths, solve_file
+from heuristics import JeroslowWang, MOM
+from loader import Loader, ParseError
+from lib import Assn, UnsatException
+from preprocess import parse_passes
+
+DEFAULT_PATHS = ["small", "dat/sat", "dat/unsat"]
+DEFAULT_CONFIGS = ["dpll:mode=dpll", "cdcl:mode=cdcl"]
+# Solver options of a configuration, and their defaults
+OPTIONS = {
+    "mode": "dpll",
+    "heuristic": "vsids",
+    "polarity": "save",
+    "restart": "luby",
+    "preprocess": "all",
+}
+# SATLIB names (uf50-01.cnf, uuf50-01.cnf), or "sat"/"unsat" as a word of the name
+ANSWER_IN_NAME = re.compile(r"^(?:(uuf)|(uf))\d|(?:^|[-_.])(?:(unsat)|(sat))\d*(?:[-_.]|$)")
+# Metrics compared against the baseline, all of them lower is better
+METRICS = ["decisions", "propagations", "conflicts", "time", "peak_rss_kb"]
+# Differences below these are noise, even when above the relative threshold
+MIN_DIFFERENCE = {"decisions": 10, "propagations": 100, "conflicts": 10,
+                  "time": 0.05, "peak_rss_kb": 1024}
+
+
+def parse_config(spec):
+    '''
+    Parses "name:key=value,key=value" into (name, options)
+    '''
+    name, _, rest = spec.partition(":")
+    options = dict(OPTIONS)
+    for item in filter(None, rest.split(",")):
+        key, _, value = item.partition("=")
+        if key not in OPTIONS:
+            raise ValueError(f"Unknown option {key}")
+        options[key] = value
+    return name, options
+
+
+def expected_result(location):
+    '''
+    Returns the answer the path of an instance implies, or None if unknown
+    '''
+    directory = os.path.basename(os.path.dirname(location)).lower()
+    if directory in ("sat", "unsat"):
+        return directory.upper()
+    match = ANSWER_IN_NAME.search(os.path.basename(location).lower())
+    if match is None:
+        return None
+    unsat_prefix, sat_prefix, unsat, sat = match.groups()
+    return "UNSAT" if unsat_prefix or unsat else "SAT"
+
+
+def check(record):
+    '''
+    Returns a description of what is wrong with a record, or None
+    '''
+    expected = expected_result(record["file"])
+    if record["result"] in ("ERROR", "TIMEOUT"):
+        return record["result"] + (": " + record["error"] if "error" in record else "")
+    if expected is not None and record["result"] != expected:
+        return f"answered {record['result']}, expected {expected}"
+    if record["result"] == "SAT" and not record.get("verified"):
+        return "model does not satisfy the formula"
+    return None
+
+
+def check_vectorized(location, samples=4):
+    '''
+    Compares vectorized.Formula against the plain loops on an instance: which
+    clauses random assignments satisfy, and the initial Jeroslow-Wang and MOM
+    scores. Returns a description of the first difference, or None.
+    '''
+    try:
+        sat = Loader.load_file(location)
+    except (ParseError, UnsatException):
+        return None
+    formula = vectorized.Formula(sat)
+    clauses = [clause.lits for clause in sat.clauses[:sat.num_original]]
+    clauses.extend([lit] for lit in sat.units)
+    rng = random.Random(location)
+    for _ in range(samples):
+        values = bytearray(2 * sat.num_vars + 2)
+        for v in range(1, sat.num_vars + 1):
+            value = Assn.TRUE if rng.random() < 0.5 else Assn.FALSE
+            values[2 * v] = value
+            values[2 * v + 1] = Assn.neg(value)
+        expected = [any(values[lit] == Assn.TRUE for lit in lits) for lits in clauses]
+        batch = vectorized.np.frombuffer(values, dtype=vectorized.np.uint8)
+        if formula.satisfied(batch)[0].tolist() != expected:
+            return "vectorized satisfied clauses differ"
+        if formula.satisfied_by(values) != sat.satisfied_by(values):
+            return "vectorized model verification differs"
+    for heuristic in (JeroslowWang, MOM):
+        # Only the scores are needed, not the heap built by __init__
+        scorer = heuristic.__new__(heuristic)
+        scorer.sat = sat
+        if scorer.array_scores(sat.num_vars + 1) != scorer.loop_scores(sat.num_vars + 1):
+            return f"vectorized {heuristic.__name__} scores differ"
+    return None
+
+
+def summarize(records):
+    '''
+    Totals of the metrics over records, except memory which is the maximum
+    '''
+    totals = {metric: sum(record[metric] for record in records) for metric in METRICS}
+    totals["time"] = round(totals["time"], 6)
+    totals["peak_rss_kb"] = max((record["peak_rss_kb"] for record in records), default=0)
+    return totals
+
+
+def regressed(metric, old, new, threshold):
+    return new - old > MIN_DIFFERENCE[metric] and new > old * (1 + threshold)
+
+
+def compare(name, run, baseline, threshold, time_threshold):
+    '''
+    Compares the run of one configuration against its baseline, printing a
+    report. Returns the number of regressions.
+    '''
+    regressions = 0
+    print(f"{name}:")
+    for metric in METRICS:
+        old, new = baseline["totals"][metric], run["totals"][metric]
+        limit = time_threshold if metric == "time" else threshold
+        change = (new - old) / old * 100 if old else 0.0
+        flag = ""
+        if regressed(metric, old, new, limit):
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"    {metric:<14}{old:>14} -> {new:<14}{change:+.1f}%{flag}")
+
+    slower = []
+    for location, record in run["instances"].items():
+        old = baseline["instances"].get(location)
+        if old is None:
+            continue
+        for metric in ("decisions", "propagations", "conflicts"):
+            if regressed(metric, old[metric], record[metric], threshold):
+                slower.append((location, metric, old[metric], record[metric]))
+    if slower:
+        regressions += len(slower)
+        print(f"    {len(slower)} instance regressions, e.g.")
+        for location, metric, old, new in slower[:10]:
+            print(f"        {location}: {metric} {old} -> {new}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark solver configurations and check for regressions")
+    parser.add_argument("paths", nargs="*", default=DEFAULT_PATHS,
+                    help="CNF files, directories or glob patterns (default: small, "
+                    "dat/sat and dat/unsat)")
+    parser.add_argument("-c", "--config", action="append", default=None, metavar="NAME:OPTS",
+                    help="a configuration to benchmark, e.g. cdcl-jw:mode=cdcl,heuristic=jw. "
+                    f"Options are {', '.join(OPTIONS)}. Can be repeated, defaults to "
+                    f"{' and '.join(DEFAULT_CONFIGS)}")
+    parser.add_argument("-n", "--limit", type=int, default=None,
+                    help="only use the first N instances of every path, for quick runs")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                    help="number of worker processes (default: number of cores)")
+    parser.add_argument("-t", "--timeout", type=float, default=None,
+                    help="per-instance time limit in seconds")
+    parser.add_argument("--max-tasks-per-worker", type=int, default=None,
+                    help="restart each worker after this many instances, 1 gives exact "
+                    "per-instance memory figures")
+    parser.add_argument("--cache", metavar="DIR", default=None,
+                    help="binary formula cache directory, so every configuration after "
+                    "the first skips parsing, see sat.py")
+    parser.add_argument("-o", "--output", default=None,
+                    help="also write every record as a JSON line to this file")
+    parser.add_argument("--baseline", default=None,
+                    help="baseline file to compare the run against")
+    parser.add_argument("--save-baseline", default=None, metavar="FILE",
+                    help="store this run as a baseline in FILE")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                    help="relative growth of decisions, propagations, conflicts or memory "
+                    "counted as a regression (default: 0.10)")
+    parser.add_argument("--time-threshold", type=float, default=0.25,
+                    help="relative growth of time counted as a regression (default: 0.25)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARN)
+
+    configs = [parse_config(spec) for spec in (args.config or DEFAULT_CONFIGS)]
+    files = []
+    for path in args.paths:
+        files.extend(expand_paths([path])[:args.limit])
+
+    tasks = []
+    for name, options in configs:
+        tasks.extend((f, options["mode"], options["heuristic"], options["polarity"],
+                      options["restart"], parse_passes(options["preprocess"]), args.timeout,
+                      args.cache)
+                     for f in files)
+    names = [name for name, _ in configs for _ in files]
+
+    runs = {name: {"options": options, "instances": {}} for name, options in configs}
+    failures = []
+    out = open(args.output, "w") if args.output else None
+    with multiprocessing.Pool(args.jobs, maxtasksperchild=args.max_tasks_per_worker) as pool:
+        # imap keeps the order of tasks, so records line up with names
+        for name, record in zip(names, pool.imap(solve_file, tasks)):
+            record["config"] = name
+            if out is not None:
+                out.write(json.dumps(record) + "\n")
+            problem = check(record)
+            if problem is not None:
+                failures.append(f"{name} {record['file']}: {problem}")
+            runs[name]["instances"][record["file"]] = {
+                key: record[key] for key in ["result"] + METRICS}
+    if out is not None:
+        out.close()
+    # Only after solving, in other workers, so that NumPy is not in their memory
+    if vectorized.available():
+        with multiprocessing.Pool(args.jobs) as pool:
+            for location, problem in zip(files, pool.imap(check_vectorized, files)):
+                if problem is not None:
+                    failures.append(f"{location}: {problem}")
+    else:
+        print("NumPy is not installed, vectorized.Formula is not checked", file=sys.stderr)
+    for run in runs.values():
+        run["totals"] = summarize(list(run["instances"].values()))
+
+    for name, run in runs.items():
+        totals = run["totals"]
+        print(f"{name}: {len(run['instances'])} instances, {totals['decisions']} decisions, "
+              f"{totals['propagations']} propagations, {totals['conflicts']} conflicts, "
+              f"{totals['time']:.2f}s, peak {totals['peak_rss_kb']} KB")
+    for failure in failures:
+        print(f"FAIL {failure}")
+
+    regressions = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for name, run in runs.items():
+            if name not in baseline:
+                print(f"{name}: not in the baseline, skipped")
+                continue
+            regressions += compare(name, run, baseline[name],
+                                   args.threshold, args.time_threshold)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(runs, f, indent=1)
+
+    print(f"{len(failures)} failures, {regressions} regressions", file=sys.stderr)
+    sys.exit(1 if failures or regressions else 0)
@@ -0,0 +1,144 @@
+'''
+Binary formula cache, to skip parsing when the same CNF is solved repeatedly.
+
+A parsed formula is stored as:
+    header:     magic, format version, num_vars, number of clauses and of
+                literals, see HEADER
+    offsets:    int64 per clause plus one, clause i is lits[offsets[i]:offsets[i + 1]]
+    lits:       int32 literals, already encoded as in Lit (2 * x or 2 * x + 1),
+                deduplicated and without tautologies
+
+Arrays are in native byte order. Loading memory-maps the file and copies both
+arrays out in one go, so there is no parsing, deduplication or tautology check.
+The solver needs a Clause object per clause, so those are still built, which is
+most of the time a cached load takes (about 2 s instead of 8 s for 850k
+clauses). The mapping is closed once the copies are made, so processes loading
+the same file do not keep sharing memory.
+
+FormulaCache keys files by a hash of the content of the CNF file, so a cache
+directory stays valid when files are renamed, and edited files are re-parsed.
+'''
+import gc
+import os
+import mmap
+import struct
+import hashlib
+import tempfile
+from array import array
+from lib import Clause, SAT
+from loader import Loader, ParseError
+
+MAGIC = b"SATB"
+VERSION = 1
+# magic, version, num_vars, num_clauses, num_lits
+HEADER = struct.Struct("<4sIIIQ")
+
+
+def content_hash(location):
+    '''
+    Returns the SHA-256 hex digest of the file at location, as stored on disk
+    '''
+    h = hashlib.sha256()
+    with open(location, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def save(sat, location):
+    '''
+    Writes the input and unit clauses of sat to location, atomically, so
+    that concurrent readers never see a partial file
+    '''
+    clauses = [clause.lits for clause in sat.clauses[:sat.num_original]]
+    clauses.extend([lit] for lit in sat.units)
+    offsets = array('q', [0])
+    lits = array('i')
+    for clause in clauses:
+        lits.extend(clause)
+        offsets.append(len(lits))
+    directory = os.path.dirname(os.path.abspath(location))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, sat.num_vars, len(clauses), len(lits)))
+            offsets.tofile(f)
+            lits.tofile(f)
+        os.replace(tmp, location)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def map_arrays(location):
+    '''
+    Memory-maps a cached formula. Returns (num_vars, offsets, lits, mapping)
+    where offsets and lits are memoryviews into mapping, which must be closed
+    only after they are released.
+    '''
+    with open(location, "rb") as f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            raise ParseError(f"{location}: truncated cached formula")
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, num_vars, num_clauses, num_lits = HEADER.unpack_from(mapping)
+    start = HEADER.size
+    end = start + 8 * (num_clauses + 1) + 4 * num_lits
+    if magic != MAGIC or version != VERSION or len(mapping) != end:
+        mapping.close()
+        raise ParseError(f"{location}: not a cached formula of version {VERSION}")
+    view = memoryview(mapping)
+    offsets = view[start:start + 8 * (num_clauses + 1)].cast('q')
+    lits = view[start + 8 * (num_clauses + 1):end].cast('i')
+    view.release()
+    return num_vars, offsets, lits, mapping
+
+
+def load(location):
+    '''
+    Loads a cached formula as a SAT, copying it out of the mapping
+    '''
+    num_vars, offsets, lits, mapping = map_arrays(location)
+    try:
+        bounds = offsets.tolist()
+        all_lits = lits.tolist()
+    finally:
+        offsets.release()
+        lits.release()
+        mapping.close()
+    # Millions of new objects would trigger many pointless garbage collections
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        clauses = [Clause(all_lits[bounds[i]:bounds[i + 1]])
+                   for i in range(len(bounds) - 1)]
+        return SAT(clauses, num_vars)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class FormulaCache():
+    '''
+    Directory of cached formulas, named after the content hash of their CNF
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.directory, f"{digest}.v{VERSION}.satb")
+
+    def load_file(self, location):
+        '''
+        Loads a CNF file like Loader.load_file, from the cache if it has been
+        seen before, and stores it in the cache otherwise. stdin is never cached.
+        '''
+        if location == '-':
+            return Loader.load_file(location)
+        path = self.path(content_hash(location))
+        if os.path.exists(path):
+            return load(path)
+        sat = Loader.load_file(location)
+        save(sat, path)
+        return sat
@@ -0,0 +1,170 @@
+'''
+Checkpoints of the search state, so that a long run can be stopped and resumed.
+
+A checkpoint holds everything the search has found out so far:
+    trail:      for every decision level, its decision and the literals that
+                were set at that level without a reason clause: flipped
+                decisions in DPLL and learnt units in CDCL. Everything else on
+                the trail follows from these by unit propagation.
+    learnts:    learnt clauses with their LBD and activity
+    heuristic, polarity, restart: the state() of each, e.g. VSIDS scores
+    stats:      the search counters and time, which keep counting across runs
+
+It is stored as gzipped JSON, written atomically so that a job killed while
+writing leaves the previous checkpoint intact. It also records a hash of the
+formula searched and the solver configuration (mode, heuristic, polarity,
+restart policy and interval, seed), and refuses to resume any other.
+
+Checkpoints are taken at decisions, when propagation is done and the trail is
+consistent, every interval seconds, and at the next decision after SIGTERM,
+which batch schedulers send before preempting a job.
+'''
+import os
+import json
+import gzip
+import time
+import signal
+import hashlib
+import tempfile
+from stats import Stats
+
+VERSION = 2
+
+
+class Preempted(Exception):
+    '''
+    Raised by Checkpointer.save after a checkpoint taken because of SIGTERM
+    '''
+    pass
+
+
+def formula_hash(sat):
+    '''
+    Returns a hex digest of the input and unit clauses of sat. Literals are
+    sorted, as propagation reorders them to keep the watched ones in front.
+    '''
+    h = hashlib.sha256(f"{sat.num_vars}\n".encode())
+    for clause in sat.clauses[:sat.num_original]:
+        h.update(" ".join(map(str, sorted(clause.lits))).encode() + b"\n")
+    h.update(" ".join(map(str, sat.units)).encode())
+    return h.hexdigest()
+
+
+def config(solver, mode):
+    return {"mode": mode,
+            "heuristic": type(solver.heuristic).__name__,
+            "polarity": type(solver.polarity).__name__,
+            "restart": type(solver.restart_policy).__name__,
+            "restart_interval": solver.restart_interval,
+            "seed": solver.seed}
+
+
+def snapshot(solver, mode):
+    '''
+    Returns the checkpoint of solver, searching with mode, as a dict
+    '''
+    assignments = solver.assignments
+    sat = solver.sat
+    units = set(sat.units)
+    trail = assignments.trail
+    bounds = [0] + assignments.trail_lim + [len(trail)]
+    levels = []
+    for level in range(len(bounds) - 1):
+        start, end = bounds[level], bounds[level + 1]
+        decision = trail[start] if level > 0 else None
+        first = start + 1 if level > 0 else start
+        forced = [lit for lit in trail[first:end]
+                  if assignments.reasons[lit >> 1] == -1 and lit not in units]
+        levels.append([decision, forced])
+    learnts = []
+    for cref in sat.learnts:
+        clause = sat.clauses[cref]
+        learnts.append([clause.lits, clause.lbd, clause.activity])
+    return {
+        "version": VERSION,
+        "formula": formula_hash(sat),
+        "config": config(solver, mode),
+        "trail": levels,
+        "learnts": learnts,
+        "clause_inc": sat.clause_inc,
+        "heuristic": solver.heuristic.state(),
+        "polarity": solver.polarity.state(),
+        "restart": solver.restart_policy.state(),
+        "reduce": [solver.reduce_interval, solver.next_reduce],
+        "stats": {field: getattr(solver.stats, field) for field in Stats.FIELDS},
+        "time": solver.stats.elapsed(),
+    }
+
+
+def save(solver, mode, location):
+    '''
+    Writes the checkpoint of solver to location, replacing any previous one
+    '''
+    directory = os.path.dirname(os.path.abspath(location))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with gzip.open(os.fdopen(fd, "wb"), "wt") as f:
+            json.dump(snapshot(solver, mode), f, separators=(",", ":"))
+        os.replace(tmp, location)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load(location):
+    with gzip.open(location, "rt") as f:
+        return json.load(f)
+
+
+def restore(solver, mode, state):
+    '''
+    Restores a checkpoint into a new solver for the same formula, before
+    solve is called. The trail is replayed by solve, once units are assigned.
+    Raises ValueError if the checkpoint is of another formula or configuration.
+    '''
+    if state.get("version") != VERSION:
+        raise ValueError(f"Checkpoint is not of version {VERSION}")
+    if state["formula"] != formula_hash(solver.sat):
+        raise ValueError("Checkpoint is of another formula or preprocessing")
+    if state["config"] != config(solver, mode):
+        raise ValueError(f"Checkpoint was made with {state['config']}")
+    sat = solver.sat
+    # Nothing is assigned yet, so any literals can be watched
+    for lits, lbd, activity in state["learnts"]:
+        sat.clauses[sat.add_learnt(lits, lbd)].activity = activity
+    sat.clause_inc = state["clause_inc"]
+    solver.heuristic.restore(state["heuristic"])
+    solver.polarity.restore(state["polarity"])
+    solver.restart_policy.restore(state["restart"])
+    solver.reduce_interval, solver.next_reduce = state["reduce"]
+    for field, value in state["stats"].items():
+        setattr(solver.stats, field, value)
+    solver.stats.start -= state["time"]
+    solver.resume_trail = state["trail"]
+
+
+class Checkpointer():
+    '''
+    Decides when the solver takes checkpoints and writes them to location.
+    Installs a SIGTERM handler that makes the next decision save and stop.
+    '''
+
+    def __init__(self, location, mode, interval=300.0):
+        self.location = location
+        self.mode = mode
+        self.interval = interval
+        self.next_save = time.perf_counter() + interval
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+
+    def due(self):
+        return self.stopping or time.perf_counter() >= self.next_save
+
+    def save(self, solver):
+        save(solver, self.mode, self.location)
+        self.next_save = time.perf_counter() + self.interval
+        if self.stopping:
+            raise Preempted()
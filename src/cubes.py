@@ -0,0 +1,124 @@
+'''
+Cube-and-conquer: splits one formula into independent subproblems and solves
+them in parallel.
+
+The cube phase is a lookahead search up to a fixed depth. At every node, each
+unassigned variable is tried both ways with unit propagation, and the one
+whose two branches propagate the most (by the product of both counts) is
+split on. Branches that fail right away are dropped, so at most 2^depth cubes
+(partial assignments) are left.
+
+The conquer phase solves the formula under each cube, as assumptions to CDCL,
+across a process pool. The first satisfiable cube answers the whole formula.
+The formula is unsatisfiable once every cube has been refuted.
+'''
+import multiprocessing
+from lib import Assn
+from sat import SATSolver
+
+
+def _propagated(assignments, lit):
+    '''
+    Returns how many literals deciding lit assigns, or -1 if it leads to a conflict
+    '''
+    level = assignments.decision_level()
+    before = len(assignments.trail)
+    assignments.create_decision_level(lit)
+    if assignments.unit_propagation() < 0:
+        count = -1
+    else:
+        count = len(assignments.trail) - before
+    assignments.backjump(level)
+    return count
+
+
+def lookahead(assignments):
+    '''
+    Returns the unassigned variable whose two branches together propagate the
+    most, preferring variables with a failing branch, or None if all are assigned
+    '''
+    values = assignments.values
+    best, best_score = None, -1
+    for var_ in range(1, assignments.num_vars + 1):
+        if values[2 * var_] != Assn.UNKNOWN:
+            continue
+        pos = _propagated(assignments, 2 * var_)
+        neg = _propagated(assignments, 2 * var_ + 1)
+        if pos < 0 or neg < 0:
+            return var_
+        score = pos * neg
+        if score > best_score:
+            best, best_score = var_, score
+    return best
+
+
+def make_cubes(sat, depth):
+    '''
+    Returns the cubes of sat as lists of literals, an empty list if the
+    lookahead already refutes the formula
+    '''
+    assignments = SATSolver(sat).assignments
+    if not assignments.assign_units() or assignments.unit_propagation() < 0:
+        return []
+    cubes = []
+
+    def split(cube, depth):
+        var_ = lookahead(assignments) if depth > 0 else None
+        if var_ is None:
+            cubes.append(cube)
+            return
+        level = assignments.decision_level()
+        for lit in (2 * var_, 2 * var_ + 1):
+            assignments.create_decision_level(lit)
+            if assignments.unit_propagation() >= 0:
+                split(cube + [lit], depth - 1)
+            assignments.backjump(level)
+
+    split([], depth)
+    return cubes
+
+
+# Set in every worker by _init_worker, inherited through fork
+_sat = None
+_options = None
+
+
+def _init_worker(sat, options):
+    global _sat, _options
+    _sat = sat
+    _options = options
+
+
+def _solve_cube(cube):
+    solver = SATSolver(_sat, **_options)
+    result = solver.solve("cdcl", cube)
+    return result, bytes(solver.assignments.values) if result else None
+
+
+def solve_cubes(sat, depth, jobs, progress=None, **options):
+    '''
+    Solves sat by cube-and-conquer with the given lookahead depth and number of
+    worker processes.
+
+    progress:   called as progress(refuted, total) after every refuted cube
+    options:    passed on to the SATSolver of every cube
+
+    Returns (result, values) where values are the assignment values of a model,
+    indexed by literal, or None if unsatisfiable.
+    '''
+    cubes = make_cubes(sat, depth)
+    if progress is not None:
+        progress(0, len(cubes))
+    if not cubes:
+        return False, None
+    ctx = multiprocessing.get_context("fork")
+    with ctx.Pool(jobs, initializer=_init_worker, initargs=(sat, options)) as pool:
+        refuted = 0
+        for result, values in pool.imap_unordered(_solve_cube, cubes):
+            if result:
+                # Leaving the with block terminates the remaining cubes
+                return True, bytearray(values)
+            refuted += 1
+            if progress is not None:
+                progress(refuted, len(cubes))
+    return False, None
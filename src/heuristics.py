@@ -1,73 +1,452 @@
 '''
-Define your heuristics for choosing variables, and the value to assign first 
+Define your heuristics for choosing variables, and the value to assign first
 in this file
+
+Branching heuristics are classes deriving from BranchingHeuristic. They are
+told about every unassignment and conflict, so they can keep their state
+up to date incrementally instead of rescanning the formula on each decision.
+To add your own, subclass BranchingHeuristic and register it in HEURISTICS,
+which also makes it selectable with --heuristic in sat.py.
+
+Likewise, the value tried first is chosen by a PolarityHeuristic, registered
+in POLARITIES and selectable with --polarity.
 '''
-import random
+import vectorized
 from lib import Assn
 
 
-def choose_splitting_var(assignments, sat):
+class VarHeap():
+    '''
+    Binary max-heap of variable labels, ordered by an external score array.
+
+    Also keeps the position of every label in the heap, so membership tests are
+    O(1), and a label whose score increased can be moved up in O(log n).
+
+    scores: array indexed by variable label
+    '''
+
+    def __init__(self, scores):
+        self.scores = scores
+        self.heap = []
+        self.indices = [-1] * len(scores)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, label):
+        return self.indices[label] >= 0
+
+    def grow(self):
+        '''
+        Makes room for one more label, whose score must already be in scores
+        '''
+        self.indices.append(-1)
+
+    def insert(self, label):
+        if self.indices[label] >= 0:
+            return
+        self.indices[label] = len(self.heap)
+        self.heap.append(label)
+        self._sift_up(len(self.heap) - 1)
+
+    def increase(self, label):
+        '''
+        Restores the heap order after the score of label has increased
+        '''
+        if self.indices[label] >= 0:
+            self._sift_up(self.indices[label])
+
+    def pop(self):
+        '''
+        Removes and returns the label with the highest score
+        '''
+        top = self.heap[0]
+        last = self.heap.pop()
+        self.indices[top] = -1
+        if self.heap:
+            self.heap[0] = last
+            self.indices[last] = 0
+            self._sift_down(0)
+        return top
+
+    def _sift_up(self, pos):
+        heap, indices, scores = self.heap, self.indices, self.scores
+        label = heap[pos]
+        while pos > 0:
+            parent = (pos - 1) >> 1
+            if scores[heap[parent]] >= scores[label]:
+                break
+            heap[pos] = heap[parent]
+            indices[heap[pos]] = pos
+            pos = parent
+        heap[pos] = label
+        indices[label] = pos
+
+    def _sift_down(self, pos):
+        heap, indices, scores = self.heap, self.indices, self.scores
+        label = heap[pos]
+        size = len(heap)
+        while True:
+            child = 2 * pos + 1
+            if child >= size:
+                break
+            if child + 1 < size and scores[heap[child + 1]] > scores[heap[child]]:
+                child += 1
+            if scores[heap[child]] <= scores[label]:
+                break
+            heap[pos] = heap[child]
+            indices[heap[pos]] = pos
+            pos = child
+        heap[pos] = label
+        indices[label] = pos
+
+
+class BranchingHeuristic():
+    '''
+    Interface for choosing which variable to split on.
+    Variables are the ints 1 to num_vars.
+
+    num_vars:   number of variables of the formula
+    sat:        the SAT formula being solved
+    '''
+
+    def __init__(self, num_vars, sat):
+        self.num_vars = num_vars
+        self.sat = sat
+
+    def pick(self, assignments):
+        '''
+        Returns the variable to split on, this should not be assigned.
+        Only called when at least one variable is unassigned.
+        '''
+        raise NotImplementedError
+
+    def unassigned(self, variable):
+        '''
+        Called whenever variable loses its assignment due to backtracking
+        '''
+        pass
+
+    def bump(self, variable):
+        '''
+        Called for every variable involved in a conflict
+        '''
+        pass
+
+    def new_var(self):
+        '''
+        Called when variable num_vars + 1 is added to the formula during solving
+        '''
+        self.num_vars += 1
+
+    def randomize(self, rng):
+        '''
+        Called before search with a random.Random to perturb the initial order,
+        so that differently seeded solvers explore different parts of the search
+        '''
+        pass
+
+    def decay(self):
+        '''
+        Called once after every conflict, once all variables have been bumped
+        '''
+        pass
+
+    def state(self):
+        '''
+        Returns what the heuristic learnt during search as a JSON-serializable
+        dict, for checkpoints
+        '''
+        return {}
+
+    def restore(self, state):
+        '''
+        Continues from a state returned by state(), called before search
+        '''
+        pass
+
+
+class FirstUnassigned(BranchingHeuristic):
+    '''
+    Chooses the unassigned variable with the smallest label.
+
+    We keep a cursor to the first variable that may be unassigned, and
+    only move it back when backtracking unassigns an earlier variable.
+    '''
+
+    def __init__(self, num_vars, sat):
+        super().__init__(num_vars, sat)
+        self.next = 1
+
+    def pick(self, assignments):
+        values = assignments.values
+        while values[2 * self.next] != Assn.UNKNOWN:
+            self.next += 1
+        return self.next
+
+    def unassigned(self, variable):
+        if variable < self.next:
+            self.next = variable
+
+
+class HeapHeuristic(BranchingHeuristic):
+    '''
+    Chooses the unassigned variable with the highest score, kept in a VarHeap.
+
+    Assigned variables are only removed from the heap lazily when they reach
+    the top, and are reinserted when backtracking unassigns them.
+    '''
+
+    def __init__(self, num_vars, sat):
+        super().__init__(num_vars, sat)
+        self.scores = self.initial_scores(num_vars + 1)
+        self.heap = VarHeap(self.scores)
+        for variable in range(1, num_vars + 1):
+            self.heap.insert(variable)
+
+    def initial_scores(self, num_labels):
+        return [0.0] * num_labels
+
+    def pick(self, assignments):
+        values = assignments.values
+        while True:
+            variable = self.heap.pop()
+            if values[2 * variable] == Assn.UNKNOWN:
+                return variable
+
+    def unassigned(self, variable):
+        self.heap.insert(variable)
+
+    def new_var(self):
+        super().new_var()
+        self.scores.append(0.0)
+        self.heap.grow()
+        self.heap.insert(self.num_vars)
+
+    def randomize(self, rng):
+        # Small enough to only break ties and reorder near-equal scores
+        top = max(self.scores, default=0.0) or 1.0
+        for variable in range(1, self.num_vars + 1):
+            self.scores[variable] += rng.random() * top * 1e-3
+        self.heap = VarHeap(self.scores)
+        for variable in range(1, self.num_vars + 1):
+            self.heap.insert(variable)
+
+    def state(self):
+        return {"scores": self.scores}
+
+    def restore(self, state):
+        self.scores[:] = state["scores"]
+        self.heap = VarHeap(self.scores)
+        for variable in range(1, self.num_vars + 1):
+            self.heap.insert(variable)
+
+
+class VSIDS(HeapHeuristic):
+    '''
+    Exponential VSIDS: the activity of every variable involved in a conflict is
+    bumped, and instead of decaying all activities after each conflict we grow
+    the bump increment, which has the same effect on the ordering.
+
+    decay_factor: how much older conflicts count compared to the latest one
+    '''
+    RESCALE_LIMIT = 1e100
+
+    def __init__(self, num_vars, sat, decay_factor=0.95):
+        super().__init__(num_vars, sat)
+        self.increment = 1.0
+        self.decay_factor = decay_factor
+
+    def bump(self, variable):
+        self.scores[variable] += self.increment
+        if self.scores[variable] > self.RESCALE_LIMIT:
+            # Scale everything down to avoid overflow, ordering is unchanged
+            for i in range(len(self.scores)):
+                self.scores[i] *= 1 / self.RESCALE_LIMIT
+            self.increment *= 1 / self.RESCALE_LIMIT
+        self.heap.increase(variable)
+
+    def decay(self):
+        self.increment /= self.decay_factor
+
+    def state(self):
+        return {"scores": self.scores, "increment": self.increment}
+
+    def restore(self, state):
+        super().restore(state)
+        self.increment = state["increment"]
+
+
+class JeroslowWang(HeapHeuristic):
+    '''
+    Static two-sided Jeroslow-Wang: a variable scores 2^-|C| for every
+    clause C it appears in, favouring variables in short clauses. Large
+    formulas are scored with array operations, see vectorized.worthwhile.
+    '''
+
+    def initial_scores(self, num_labels):
+        if vectorized.worthwhile(self.sat):
+            return self.array_scores(num_labels)
+        return self.loop_scores(num_labels)
+
+    def array_scores(self, num_labels):
+        return vectorized.Formula(self.sat, units=False).jeroslow_wang().tolist()
+
+    def loop_scores(self, num_labels):
+        scores = [0.0] * num_labels
+        for clause in self.sat.clauses[:self.sat.num_original]:
+            weight = 2.0 ** -len(clause.lits)
+            for lit in clause.lits:
+                scores[lit >> 1] += weight
+        return scores
+
+
+class MOM(HeapHeuristic):
     '''
-    Custom function to choose which variable to split on, this
-    can be modified by user to specify their own heuristic
+    Static MOM (Maximum Occurrences in clauses of Minimum size): counts the
+    positive and negative occurrences f(x), f(NOT x) of every variable in the
+    shortest clauses of the formula and scores it with
+    (f(x) + f(NOT x)) * 2^k + f(x) * f(NOT x), preferring balanced variables.
+    Large formulas are scored with array operations, see vectorized.worthwhile.
+    '''
+    K = 10
+
+    def initial_scores(self, num_labels):
+        if vectorized.worthwhile(self.sat):
+            return self.array_scores(num_labels)
+        return self.loop_scores(num_labels)
+
+    def array_scores(self, num_labels):
+        formula = vectorized.Formula(self.sat, units=False)
+        if formula.num_clauses == 0:
+            return [0.0] * num_labels
+        occurrences = formula.occurrences(int(formula.lengths.min()))
+        pos = occurrences[0::2]
+        neg = occurrences[1::2]
+        return ((pos + neg) * 2 ** self.K + pos * neg).tolist()
+
+    def loop_scores(self, num_labels):
+        scores = [0.0] * num_labels
+        clauses = self.sat.clauses[:self.sat.num_original]
+        if not clauses:
+            return scores
+        min_size = min(len(clause.lits) for clause in clauses)
+        occurrences = [0] * (2 * num_labels)
+        for clause in clauses:
+            if len(clause.lits) != min_size:
+                continue
+            for lit in clause.lits:
+                occurrences[lit] += 1
+        pos = occurrences[0::2]
+        neg = occurrences[1::2]
+        for label in range(num_labels):
+            scores[label] = (pos[label] + neg[label]) * 2 ** self.K + pos[label] * neg[label]
+        return scores
+
+
+# Heuristics selectable by name
+HEURISTICS = {
+    "first": FirstUnassigned,
+    "vsids": VSIDS,
+    "jw": JeroslowWang,
+    "mom": MOM,
+}
 
-    The current sample implementation just chooses a variable randomly 
-    from the remaining variables.
 
-    assignments:    a map of the current variable to the current assignments
-    sat:            the current SAT formula
+class PolarityHeuristic():
+    '''
+    Interface for choosing which truth value to try first for a splitting variable.
 
-    return: the variable to split on, this should not be assigned
+    num_vars:   number of variables of the formula
+    sat:        the SAT formula being solved
     '''
-    # Comment below to not use default policy that simply uses the
-    # first unassigned variable
-    raise NotImplementedError
 
-    # ===================================================
-    # Random strategy: uncomment to use
-    # candidates = []
-    # for var_, assn in assignments.items():
-    #     if assn == Assn.UNKNOWN:
-    #         candidates.append(var_)
-    # return candidates[random.randrange(len(candidates))]
-    # ===================================================
+    def __init__(self, num_vars, sat):
+        self.num_vars = num_vars
+        self.sat = sat
+
+    def choose(self, variable, assignments):
+        '''
+        Returns either Assn.TRUE or Assn.FALSE for the unassigned variable
+        '''
+        raise NotImplementedError
+
+    def unassigned(self, variable, assn):
+        '''
+        Called whenever backtracking takes the value assn away from variable
+        '''
+        pass
+
+    def new_var(self):
+        '''
+        Called when variable num_vars + 1 is added to the formula during solving
+        '''
+        self.num_vars += 1
+
+    def state(self):
+        '''
+        Returns the state of the heuristic as a JSON-serializable dict, for checkpoints
+        '''
+        return {}
+
+    def restore(self, state):
+        '''
+        Continues from a state returned by state(), called before search
+        '''
+        pass
 
-def choose_assn(var_, assignments, sat):
+
+class AlwaysTrue(PolarityHeuristic):
+    '''
+    Always tries True first, followed by False
     '''
-    Custom function to choose which truth value to try first, this
-    can be modified by user to specify their own heuristic.
 
-    The current sample implementation chooses randomly.
+    def choose(self, variable, assignments):
+        return Assn.TRUE
 
-    var_:           unassigned variable to choose first truth assignment for
-    assignments:    a map of the current assignments
-    sat:            current SAT instance
 
-    return: either Assn.TRUE or Assn.FALSE
+class OccurrencePolarity(PolarityHeuristic):
+    '''
+    Uses the value that satisfies most of the clauses the variable appears in.
+    The counts are taken once over the input clauses, so choosing is a lookup.
     '''
-    # Comment below to not use default policy that simply uses True
-    # first followed by False
-    raise NotImplementedError
 
-    # ===================================================
-    # Random strategy: uncomment to use
-    # return Assn.TRUE if random.randint(0, 1) == 1 else Assn.FALSE
-    # ===================================================
+    def __init__(self, num_vars, sat):
+        super().__init__(num_vars, sat)
+        balance = [0] * (num_vars + 1)
+        for clause in sat.clauses[:sat.num_original]:
+            for lit in clause.lits:
+                balance[lit >> 1] += -1 if lit & 1 else 1
+        self.phase = [Assn.TRUE if b >= 0 else Assn.FALSE for b in balance]
+
+    def choose(self, variable, assignments):
+        return self.phase[variable]
+
+    def new_var(self):
+        super().new_var()
+        self.phase.append(Assn.TRUE)
+
+    def state(self):
+        return {"phase": self.phase}
+
+    def restore(self, state):
+        self.phase[:] = state["phase"]
+
+
+class PhaseSaving(OccurrencePolarity):
+    '''
+    Phase saving: reuses the value a variable last had before backtracking
+    undid it, so that solved parts of the formula are not thrown away.
+    Variables that were never assigned start from the occurrence table.
+    '''
 
+    def unassigned(self, variable, assn):
+        self.phase[variable] = assn
 
-    # ===================================================
-    # Using the value that satisfies most of the clauses that it appears in 
-    # Uncomment to use
-    # pos_instance = 0
-    # neg_instance = 0
-    # for clause in sat.clauses:
-    #     for v in clause.vars:
-    #         if v.var == var_:
-    #             if v.isNeg():
-    #                 neg_instance += 1
-    #             else:
-    #                 pos_instance += 1
-    # return Assn.TRUE if pos_instance >= neg_instance else Assn.FALSE
-    # ===================================================
 
-    
+# Polarity heuristics selectable by name
+POLARITIES = {
+    "true": AlwaysTrue,
+    "occurrence": OccurrencePolarity,
+    "save": PhaseSaving,
+}
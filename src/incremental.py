@@ -0,0 +1,97 @@
+'''
+Library API for solving many closely related formulas with one solver.
+
+Clauses and variables can be added between calls to solve, and each call can
+assume some literals true for that call only. Watches, learnt clauses and
+heuristic state carry over from one call to the next, so related queries do
+not start from scratch. Literals are DIMACS numbers throughout, e.g.
+
+    solver = IncrementalSolver()
+    solver.add_clause([1, -2])
+    solver.add_clause([2, 3])
+    solver.solve(assumptions=[-1, -3])     # Result(UNSAT, core=[-3, -1])
+    solver.solve(assumptions=[-1]).model   # [-1, -2, 3]
+
+Clauses are never removed, so there is no preprocessing: eliminating a
+variable would be wrong as soon as a later clause mentions it.
+'''
+from lib import Assn, Lit, SAT
+from sat import SATSolver
+
+
+class Result():
+    '''
+    The answer to a call to IncrementalSolver.solve
+
+    satisfiable:    whether the formula is satisfiable under the assumptions
+    model:          if satisfiable, the DIMACS literal of every variable that is
+                    true in the model, i.e. v or -v for v from 1 to num_vars
+    core:           if unsatisfiable, the assumptions that make it so, empty
+                    if the formula is unsatisfiable without any assumptions
+    '''
+
+    def __init__(self, satisfiable, model=None, core=None):
+        self.satisfiable = satisfiable
+        self.model = model
+        self.core = core
+
+    def __bool__(self):
+        return self.satisfiable
+
+    def __repr__(self):
+        if self.satisfiable:
+            return f"Result(SAT, model={self.model})"
+        return f"Result(UNSAT, core={self.core})"
+
+
+class IncrementalSolver():
+    '''
+    Keeps one CDCL SATSolver alive across calls to solve.
+
+    sat:        formula to start from, e.g. from Loader.load_file, defaults to
+                an empty one
+    options:    passed on to SATSolver, e.g. heuristic="jw"
+    '''
+
+    def __init__(self, sat=None, **options):
+        if sat is None:
+            sat = SAT([], 0)
+        self.solver = SATSolver(sat, **options)
+
+    @property
+    def num_vars(self):
+        return self.solver.sat.num_vars
+
+    def new_var(self):
+        '''
+        Adds a variable, returning its DIMACS label
+        '''
+        return self.solver.new_var()
+
+    def add_clause(self, clause):
+        '''
+        Adds a clause of DIMACS literals. Variables that do not exist yet are
+        added first.
+        '''
+        for num in clause:
+            assert num != 0, "0 is not a literal"
+            while abs(num) > self.num_vars:
+                self.new_var()
+        self.solver.add_clause([Lit.fromDimacs(num) for num in clause])
+
+    def solve(self, assumptions=()):
+        '''
+        Solves the formula with the DIMACS literals in assumptions made true
+        for this call only, returning a Result
+        '''
+        for num in assumptions:
+            while abs(num) > self.num_vars:
+                self.new_var()
+        lits = [Lit.fromDimacs(num) for num in assumptions]
+        if self.solver.solve("cdcl", lits):
+            values = self.solver.assignments.values
+            model = [v if values[2 * v] == Assn.TRUE else -v
+                     for v in range(1, self.num_vars + 1)]
+            return Result(True, model=model)
+        core = self.solver.core or []
+        return Result(False, core=[Lit.toDimacs(lit) for lit in core])
@@ -1,149 +1,102 @@
-from enum import Enum
 from typing import List
-import logging
-
-# Global map of all variables defined
-VARIABLES = {}
 
 
 class UnsatException(Exception):
     pass
 
 
-class Assn(Enum):
+class Assn():
     '''
     Represents the value of assignment
+
+    These are plain ints rather than an Enum, so that they can be stored in a
+    bytearray and compared without any attribute lookups on the hot path.
     '''
-    UNKNOWN = -1
     FALSE = 0
     TRUE = 1
+    UNKNOWN = 2
+
+    _STR = ("F", "T", "U")
+    _NEG = (TRUE, FALSE, UNKNOWN)
 
     @staticmethod
     def toStr(assn):
-        if assn == Assn.UNKNOWN:
-            return "U"
-        elif assn == Assn.FALSE:
-            return "F"
-        elif assn == Assn.TRUE:
-            return "T"
+        return Assn._STR[assn]
 
     @staticmethod
     def neg(assn):
-        if assn == Assn.UNKNOWN:
-            return Assn.UNKNOWN
-        elif assn == Assn.FALSE:
-            return Assn.TRUE
-        elif assn == Assn.TRUE:
-            return Assn.FALSE
-
+        return Assn._NEG[assn]
 
-class Var():
-    '''
-    Represents either x or NOT x, where x is a Variable
-    This is what actually appears in a clause. 
-    Var are singletons, and new Vars should only be instantiated
-    with VarFactory
 
-    self.neg: Whether the literal is x or not x
-    self.var: base variable
+class Lit():
     '''
+    Literals are encoded as ints: x is 2 * x and NOT x is 2 * x + 1.
 
-    def __init__(self, var_, neg=False):
-        self.neg = neg
-        self.var = var_
-        self.watchedBy = []
-
-    def __repr__(self):
-        if self.neg:
-          return "¬" + repr(self.var)
-        return repr(self.var)
-
-    def addWatchedBy(self, clause):
-        if clause not in self.watchedBy:
-          self.watchedBy.append(clause)
-
-    def removeWatchedBy(self, clause):
-        self.watchedBy.remove(clause)
-
-    def isNeg(self):
-        return self.neg
-
-    def watchingClauses(self):
-        return self.watchedBy
-
-
-class Variable():
+    So the negation of a literal is lit ^ 1 and its variable is lit >> 1.
+    Hot loops use these operations directly, the helpers here are for
+    everywhere else. Variables are numbered by their DIMACS label, 1 upwards.
     '''
-    Represents an abstract variable, i.e x
-    This does not contain info on whether it is negated, 
-    that falls under the domain of Var.
-
-    So normally, we have a relationship that looks like this:
 
-                  ----- Var (x)
-    Variable (x) /
-                 \------Var (NOT x)
-
-    Variables are singletons, and is implicitly created
-    by VarFactory when instantiating Vars.
+    @staticmethod
+    def make(label: int, neg=False):
+        return 2 * label + (1 if neg else 0)
 
-    label: the label of the variable
-    '''
+    @staticmethod
+    def var(lit):
+        return lit >> 1
 
-    def __init__(self, label: int):
-        assert label not in VARIABLES
-        self.label = label
-        VARIABLES[label] = self
-        self.pos = Var(self, False)
-        self.neg = Var(self, True)
+    @staticmethod
+    def isNeg(lit):
+        return lit & 1 == 1
 
-    def __repr__(self):
-        return 'x' + str(self.label)
+    @staticmethod
+    def negate(lit):
+        return lit ^ 1
 
-    def getPos(self):
-        '''Get positive representation, i.e x
+    @staticmethod
+    def fromDimacs(num: int):
+        '''Get the literal for a DIMACS number, i.e -3 for NOT x3
         '''
-        return self.pos
+        return 2 * num if num > 0 else -2 * num + 1
 
-    def getNeg(self):
-        '''Get negative representation, i.e not x
+    @staticmethod
+    def toDimacs(lit):
+        '''Get the DIMACS number of the literal, i.e -3 for NOT x3
         '''
-        return self.neg
-
+        return -(lit >> 1) if lit & 1 else lit >> 1
 
-class VarFactory():
-    '''
-    Factory for getting singleton vars
-    '''
     @staticmethod
-    def get_var(label: int, neg: bool):
-        if label in VARIABLES:
-            return VARIABLES[label].getNeg() if neg else VARIABLES[label].getPos()
-        var_ = Variable(label)
-        return var_.getNeg() if neg else var_.getPos()
+    def toStr(lit):
+        if lit & 1:
+            return "¬x" + str(lit >> 1)
+        return "x" + str(lit >> 1)
 
 
 class Clause():
     '''
     A CNF clause
+
+    lits:     the literals of the clause. The two watched literals are always
+              kept in lits[0] and lits[1], so no separate watchlist is needed.
+    learnt:   whether the clause was derived by conflict analysis, not in the input
+    lbd:      literal block distance when learnt, lowest seen since. Learnt only.
+    activity: how recently and often the clause took part in conflicts. Learnt only.
     '''
-    def __init__(self, variables: List[Var]):
-        self.vars = variables
-        assert len(self.vars) >= 2  # Temporary assumption
+    __slots__ = ("lits", "learnt", "lbd", "activity")
 
-        # Initialize watchlist on first two indices
-        # Watchlist contains index of variables watched
-        self.watchlist = [0, 1]
-        self.vars[0].addWatchedBy(self)
-        self.vars[1].addWatchedBy(self)
+    def __init__(self, lits: List[int], learnt=False, lbd=0):
+        self.lits = lits
+        self.learnt = learnt
+        self.lbd = lbd
+        self.activity = 0.0
 
     def __repr__(self):
         l = []
-        for idx, var in enumerate(self.vars):
-            if idx in self.watchlist:
-                l.append(repr(var) + "*")
+        for idx, lit in enumerate(self.lits):
+            if idx < 2:
+                l.append(Lit.toStr(lit) + "*")
             else:
-                l.append(repr(var))
+                l.append(Lit.toStr(lit))
 
         v = " ∨ ".join(l)
         return f"({v})"
@@ -153,93 +106,169 @@ class Clause():
         Pretty print with current assignment info
         '''
         l = []
-        for idx, var in enumerate(self.vars):
-            assn = Assn.toStr(assignment.get_assignment_val(var))
-            if idx in self.watchlist:
-                l.append(repr(var) + f"{assn}*")
+        for idx, lit in enumerate(self.lits):
+            assn = Assn.toStr(assignment.get_assignment_val(lit))
+            if idx < 2:
+                l.append(Lit.toStr(lit) + f"{assn}*")
             else:
-                l.append(repr(var) + f"{assn}")
+                l.append(Lit.toStr(lit) + f"{assn}")
 
         v = " ∨ ".join(l)
         return f"({v})"
 
-    def is_watching_true(self, assignment):
+
+class SAT():
+    '''
+    A SAT formula in CNF form, together with its watch lists
+
+    num_vars:       variables are numbered 1 to num_vars
+    clauses:        every clause, the index of a clause in this list is its clause
+                    reference (cref). The input clauses come first. Slots of
+                    deleted learnt clauses are None until they are reused.
+    num_original:   number of input clauses, i.e. clauses[:num_original]
+    units:          literals of the clauses with a single literal. These cannot
+                    be watched, so they are assigned before search instead.
+    learnts:        crefs of clauses learnt from conflicts during CDCL search
+    free:           crefs of deleted learnt clauses, reused by the next ones
+    watches:        watches[lit] is the list of crefs of clauses watching lit
+    '''
+    CLAUSE_DECAY = 0.999
+    RESCALE_LIMIT = 1e20
+
+    def __init__(self, clauses, num_vars):
+        self.num_vars = num_vars
+        self.clauses = []
+        self.learnts = []
+        self.free = []
+        self.units = []
+        # Bumped clause activity, grows instead of decaying every activity
+        self.clause_inc = 1.0
+        self.watches = [[] for _ in range(2 * num_vars + 2)]
+        for clause in clauses:
+            self.add_clause(clause)
+        self.num_original = len(self.clauses)
+
+    def __repr__(self):
+        return " ∧ ".join([repr(c) for c in self.clauses[:self.num_original]])
+
+    def new_var(self):
         '''
-        Returns if at least one of the variables that this clause is watching is true
+        Adds a variable, returning its label
         '''
-        var1 = self.vars[self.watchlist[0]]
-        var2 = self.vars[self.watchlist[1]]
-        return assignment.get_assignment_val(var1) == Assn.TRUE or \
-            assignment.get_assignment_val(var2) == Assn.TRUE
+        self.num_vars += 1
+        self.watches.append([])
+        self.watches.append([])
+        return self.num_vars
 
-    def is_not_just_watching_false(self, assignment):
+    def add_clause(self, clause: Clause):
         '''
-        Returns if at least one of the variables that this clause is watching is non-false
+        Adds a clause of the formula. Returns its cref, or -1 for a unit clause.
+        Clauses added after construction are not counted in num_original.
         '''
-        var1 = self.vars[self.watchlist[0]]
-        var2 = self.vars[self.watchlist[1]]
-        return assignment.get_assignment_val(var1) != Assn.FALSE or \
-            assignment.get_assignment_val(var2) != Assn.FALSE
+        assert len(clause.lits) > 0, "Empty clause, the formula is unsatisfiable"
+        if len(clause.lits) == 1:
+            self.units.append(clause.lits[0])
+            return -1
+        return self.attach(clause)
 
-    def resolve_watch(self, var_to_change: Var, assignment):
+    def attach(self, clause: Clause):
         '''
-        Called when both literals being watched is false
-        This function tries to find another literal to watch instead of var_to_change
-
-        If it succeeds, returns 0
-        Else returns negative int
+        Adds a clause, watching its first two literals. Returns its cref.
         '''
-        logging.debug("Resolving clause " + self.pp(assignment) +
-                      " due to " + repr(var_to_change))
-
-        # Find index in watchlist
-        to_change_wl_idx = 0 if self.vars[self.watchlist[0]
-                                          ] == var_to_change else 1
-        other_wl_idx = 1 - to_change_wl_idx
-        to_change_var_idx = self.watchlist[to_change_wl_idx]
-        other_var_idx = self.watchlist[other_wl_idx]
-
-        new_idx = -1  # new idx to watch
-        for idx, var in enumerate(self.vars):
-            if idx == to_change_var_idx or idx == other_var_idx:
-                continue
-
-            # Check if not false
-            if assignment.get_assignment_val(var) != Assn.FALSE:
-                new_idx = idx
-                break
-
-        # If not possible to find any other index to watch because everything else is false, then the other literal being watched must be false
-        if new_idx == -1:
-            other_watched_var = self.vars[other_var_idx]
-            if assignment.get_assignment_val(other_watched_var) == Assn.FALSE:
-                # If already assigned to false, we have a contradiction, need
-                # to backtrack
-                return -1
-
-            # Else we force it to the value that makes it true
-            assn_val = Assn.FALSE if other_watched_var.isNeg() else Assn.TRUE
-            assignment.assign(other_watched_var.var, assn_val)
+        assert len(clause.lits) >= 2, "Only clauses of two or more literals can be watched"
+        if self.free:
+            cref = self.free.pop()
+            self.clauses[cref] = clause
         else:
-            # Else watch the indeterminate/truthy thing we found
-            self.watchlist[to_change_wl_idx] = new_idx
-            var_to_change.removeWatchedBy(self)
-            self.vars[new_idx].addWatchedBy(self)
-
-        logging.debug(f"New wl: {self.watchlist}")
-        assert self.watchlist[0] != self.watchlist[1]
+            cref = len(self.clauses)
+            self.clauses.append(clause)
+        self.watches[clause.lits[0]].append(cref)
+        self.watches[clause.lits[1]].append(cref)
+        return cref
 
-        return 0
+    def detach(self, cref):
+        '''
+        Removes the clause from the watch lists of its watched literals.
+        Watch lists are unordered, so we swap-remove instead of shifting.
+        '''
+        lits = self.clauses[cref].lits
+        for lit in (lits[0], lits[1]):
+            ws = self.watches[lit]
+            idx = ws.index(cref)
+            ws[idx] = ws[-1]
+            ws.pop()
+
+    def satisfied_by(self, values):
+        '''
+        Whether values, indexed by literal as in Assignment.values, make every
+        clause of the input true. Takes time linear in the size of the formula.
+        '''
+        TRUE = Assn.TRUE
+        for lit in self.units:
+            if values[lit] != TRUE:
+                return False
+        for clause in self.clauses[:self.num_original]:
+            for lit in clause.lits:
+                if values[lit] == TRUE:
+                    break
+            else:
+                return False
+        return True
 
+    def add_learnt(self, lits: List[int], lbd=0):
+        '''
+        Adds a learnt clause, which is immediately watched like any other clause.
+        lits[0] and lits[1] are the literals that will be watched.
+        Returns its cref.
+        '''
+        clause = Clause(lits, learnt=True, lbd=lbd)
+        clause.activity = self.clause_inc
+        cref = self.attach(clause)
+        self.learnts.append(cref)
+        return cref
 
-class SAT():
-    '''
-    A SAT formula in CNF form
-    '''
+    def remove(self, cref):
+        '''
+        Deletes a learnt clause, freeing its cref for reuse
+        '''
+        assert self.clauses[cref].learnt, "Only learnt clauses can be removed"
+        self.detach(cref)
+        self.clauses[cref] = None
+        self.free.append(cref)
 
-    def __init__(self, clauses):
-        self.clauses = clauses
+    def bump_clause(self, clause):
+        '''
+        Increases the activity of a learnt clause used in conflict analysis
+        '''
+        clause.activity += self.clause_inc
+        if clause.activity > self.RESCALE_LIMIT:
+            for cref in self.learnts:
+                self.clauses[cref].activity /= self.RESCALE_LIMIT
+            self.clause_inc /= self.RESCALE_LIMIT
 
-    def __repr__(self):
-        return " ∧ ".join([repr(c) for c in self.clauses])
+    def decay_clauses(self):
+        '''
+        Decays every clause activity, by bumping future ones more instead
+        '''
+        self.clause_inc /= self.CLAUSE_DECAY
 
+    def reduce_learnts(self, locked):
+        '''
+        Deletes the worse half of the learnt clauses: those with the highest LBD,
+        ties broken by lowest activity. Glue clauses (LBD <= 2) are always kept,
+        as are clauses for which locked(cref) is true, i.e. the current reason of
+        an assignment. Returns the number of clauses deleted.
+        '''
+        clauses = self.clauses
+        self.learnts.sort(key=lambda cref: (clauses[cref].lbd, -clauses[cref].activity))
+        half = len(self.learnts) // 2
+        kept = self.learnts[:half]
+        deleted = 0
+        for cref in self.learnts[half:]:
+            if clauses[cref].lbd <= 2 or locked(cref):
+                kept.append(cref)
+            else:
+                self.remove(cref)
+                deleted += 1
+        self.learnts = kept
+        return deleted
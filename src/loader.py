@@ -8,66 +8,161 @@ c This line is a comment.
 Problem line, which says this is a CNF problem with 3 vars and 4 clauses:
 p cnf 3 4
 
-The clauses are then listed. 0 marks the end of each clause. 
+The clauses are then listed. 0 marks the end of each clause.
 Positive numbers indicate positive occurrence, negative numbes
 represent negated occurrence.
 
+Only 0 ends a clause, so a clause may span several lines, and a clause still
+open at the end of the file is ended there. A 0 on its own is the empty
+clause, which makes the formula unsatisfiable. Files without any 0 (like
+small/small-unsat2.cnf) are read with one clause per line instead.
+
+Files are read line by line as a stream, and may be compressed with gzip, xz
+or bzip2. The literals are collected into a flat int array, with a separate
+array of offsets marking where each clause starts.
 """
-import re
+import sys
+import gzip
+import lzma
+import bz2
 import logging
-from lib import Variable, Assn, Var, Clause, SAT, VarFactory, VARIABLES
+from array import array
+from lib import Lit, Clause, SAT, UnsatException
 
 
-class Loader():
-    @staticmethod
-    def load(s):
-        """Loads a SAT expression
-        """
-        VARIABLES = {}
-        clauses = []
+class ParseError(Exception):
+    pass
 
-        lines = s.split('\n')
 
-        pComment = re.compile(r'c.*')
-        pStats = re.compile(r'p\s*cnf\s*(\d*)\s*(\d*)')
-        pEnd = re.compile(r'%')  # Some testcases are terminated by %\n0
+# Openers for compressed files, by file extension
+OPENERS = {
+    ".gz": gzip.open,
+    ".xz": lzma.open,
+    ".lzma": lzma.open,
+    ".bz2": bz2.open,
+}
 
-        while len(lines) > 0:
-            line = lines.pop(0)
 
-            # Only deal with lines that aren't comments
-            if not pComment.match(line):
-                e = pEnd.match(line)
-                if e:
-                    break
+class Loader():
+    @staticmethod
+    def parse(stream):
+        """Parses DIMACS from an iterable of lines.
 
-                m = pStats.match(line)
+        Returns (lits, offsets, header) where the literals of clause i are
+        lits[offsets[i]:offsets[i + 1]], and header is the (variables, clauses)
+        pair from the problem line, or None if there was none.
+        """
+        lits = array('i')
+        offsets = array('i', [0])
+        # Where every line of literals ends, the clauses if no 0 is ever seen
+        line_ends = array('i')
+        terminated = False
+        header = None
+
+        for lineno, line in enumerate(stream, 1):
+            tokens = line.split()
+            if not tokens:
+                continue
+            first = tokens[0]
+            if first[0] == 'c':
+                continue
+            if first[0] == '%':  # Some testcases are terminated by %\n0
+                break
+            if first == 'p':
+                if header is not None or len(tokens) != 4 or tokens[1] != 'cnf':
+                    raise ParseError(f"line {lineno}: bad problem line {line.strip()!r}")
+                try:
+                    header = (int(tokens[2]), int(tokens[3]))
+                except ValueError:
+                    raise ParseError(f"line {lineno}: bad problem line {line.strip()!r}")
+                logging.info(f"CNF with {header[0]} variables and {header[1]} clauses")
+                continue
+
+            try:
+                nums = list(map(int, tokens))
+            except ValueError:
+                raise ParseError(f"line {lineno}: bad clause {line.strip()!r}")
+            if nums[-1] == 0 and nums.count(0) == 1:
+                # Common case of exactly one clause ending on the line
+                nums.pop()
+                lits.extend(nums)
+                offsets.append(len(lits))
+                terminated = True
+            else:
+                for lit in nums:
+                    if lit == 0:
+                        offsets.append(len(lits))
+                        terminated = True
+                    else:
+                        lits.append(lit)
+                line_ends.append(len(lits))
+
+        if not terminated:
+            offsets = array('i', [0]) + line_ends
+        elif len(lits) > offsets[-1]:
+            offsets.append(len(lits))
+
+        if header is not None:
+            num_vars, num_clauses = header
+            if len(offsets) - 1 != num_clauses:
+                raise ParseError(
+                    f"problem line declares {num_clauses} clauses, found {len(offsets) - 1}")
+            if lits and max(max(lits), -min(lits)) > num_vars:
+                raise ParseError(
+                    f"problem line declares {num_vars} variables, found larger literal")
+
+        return lits, offsets, header
 
-                if not m:
-                    nums = line.rstrip('\n').split(' ')
-                    l = []
-                    for lit in nums:
-                        if lit != '':
-                            if int(lit) == 0:
-                                continue
-                            num = abs(int(lit))
-                            neg = False
-                            if int(lit) < 0:
-                                neg = True
-                            l.append(VarFactory.get_var(num, neg))
+    @staticmethod
+    def build(lits, offsets, header=None):
+        """Builds a SAT expression out of parsed literals.
+        Duplicate literals are removed, and tautologies (clauses containing
+        both x and NOT x) are dropped, as they are always satisfied.
+        Raises UnsatException if there is an empty clause.
+        """
+        num_vars = max(max(lits, default=0), -min(lits, default=0))
+        if header is not None:
+            num_vars = max(num_vars, header[0])
+        clauses = []
+        for i in range(len(offsets) - 1):
+            # dict keeps the first occurrence of each literal, in order
+            l = list(dict.fromkeys(map(Lit.fromDimacs, lits[offsets[i]:offsets[i + 1]])))
+            if not l:
+                raise UnsatException(f"clause {i + 1} is empty")
+            seen = set(l)
+            if any(lit ^ 1 in seen for lit in l):
+                continue
+            clauses.append(Clause(l))
+
+        return SAT(clauses, num_vars)
 
-                    if len(l) > 0:
-                        # Use set to dedupe
-                        clauses.append(Clause(l))
-                else:
-                    logging.info(f"CNF with {m[1]} variables and {m[2]} clauses")
+    @staticmethod
+    def load(s):
+        """Loads a SAT expression
+        """
+        lits, offsets, header = Loader.parse(s.split('\n'))
+        return Loader.build(lits, offsets, header)
 
-        return SAT(clauses)
+    @staticmethod
+    def open_file(location):
+        """Opens a CNF file for reading as text, decompressing it if needed.
+        - stands for stdin.
+        """
+        if location == '-':
+            return sys.stdin
+        for ext, opener in OPENERS.items():
+            if location.endswith(ext):
+                return opener(location, 'rt')
+        return open(location)
 
     @staticmethod
     def load_file(location):
         """Loads a CNF from a file."""
-        with open(location) as f:
-            s = f.read()
-
-        return Loader.load(s)
+        f = Loader.open_file(location)
+        try:
+            lits, offsets, header = Loader.parse(f)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+        return Loader.build(lits, offsets, header)
@@ -0,0 +1,168 @@
+'''
+Going beyond a yes/no answer: enumerating and counting models.
+
+enumerate_models streams models from a single IncrementalSolver. After each
+model, a blocking clause rules it out and the search carries on with all
+learnt clauses kept. Without a projection, the blocking clause only needs the
+decisions of the model, as unit propagation forces everything else. With a
+projection, models that agree on the projected variables count as one.
+
+count_models is an exact #SAT counter. It branches like DPLL, splits the
+formula into independent components, whose counts multiply, and caches the
+count of every component it has seen, as the same components come up again
+and again under different branches.
+
+Both work on the formula as loaded, since preprocessing changes the models.
+'''
+import sys
+from lib import Lit
+from incremental import IncrementalSolver
+
+
+def enumerate_models(sat, limit=None, projection=None, **options):
+    '''
+    Yields models of sat as lists of DIMACS literals, one per variable.
+
+    limit:      stop after this many models, None for all of them
+    projection: DIMACS labels of the variables to project the models onto,
+                only these appear in the yielded models
+    options:    passed on to SATSolver
+    '''
+    solver = IncrementalSolver(sat, **options)
+    projected = None if projection is None else set(projection)
+    count = 0
+    while limit is None or count < limit:
+        result = solver.solve()
+        if not result:
+            return
+        count += 1
+        if projected is None:
+            yield result.model
+            assignments = solver.solver.assignments
+            decisions = [assignments.trail[lim] for lim in assignments.trail_lim]
+            solver.add_clause([-Lit.toDimacs(lit) for lit in decisions])
+        else:
+            model = [num for num in result.model if abs(num) in projected]
+            yield model
+            solver.add_clause([-num for num in model])
+
+
+def _variables(clauses):
+    return {lit >> 1 for clause in clauses for lit in clause}
+
+
+def _assign(clauses, lit):
+    '''
+    Makes lit true and unit propagates. Returns (clauses, assigned) with the
+    remaining clauses and the set of variables that got assigned, or None if
+    that leads to a conflict.
+    '''
+    assigned = {}  # variable -> the literal of it made true
+    units = [lit]
+    while units:
+        lit = units.pop()
+        if lit >> 1 in assigned:
+            if assigned[lit >> 1] != lit:
+                return None
+            continue
+        assigned[lit >> 1] = lit
+        remaining = []
+        for clause in clauses:
+            if lit in clause:
+                continue
+            if lit ^ 1 in clause:
+                clause = clause - {lit ^ 1}
+                if not clause:
+                    return None
+                if len(clause) == 1:
+                    units.extend(clause)
+            remaining.append(clause)
+        clauses = remaining
+    return clauses, set(assigned)
+
+
+def _components(clauses):
+    '''
+    Splits clauses into groups that share no variables
+    '''
+    # Union-find over variables
+    parent = {}
+
+    def find(v):
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        return v
+
+    for clause in clauses:
+        vs = [lit >> 1 for lit in clause]
+        for v in vs:
+            parent.setdefault(v, v)
+        root = find(vs[0])
+        for v in vs[1:]:
+            other = find(v)
+            if other != root:
+                parent[other] = root
+    groups = {}
+    for clause in clauses:
+        groups.setdefault(find(next(iter(clause)) >> 1), []).append(clause)
+    return list(groups.values())
+
+
+class ModelCounter():
+    '''
+    Counts the models of a set of clauses over exactly their variables.
+    Clauses are frozensets of literals.
+    '''
+
+    def __init__(self):
+        self.cache = {}
+
+    def count(self, clauses):
+        if not clauses:
+            return 1
+        key = frozenset(clauses)
+        if key in self.cache:
+            return self.cache[key]
+
+        components = _components(clauses)
+        if len(components) > 1:
+            result = 1
+            for component in components:
+                result *= self.count(component)
+                if result == 0:
+                    break
+        else:
+            num_vars = len(_variables(clauses))
+            occurrences = {}
+            for clause in clauses:
+                for lit in clause:
+                    occurrences[lit >> 1] = occurrences.get(lit >> 1, 0) + 1
+            var_ = max(occurrences, key=occurrences.get)
+            result = 0
+            for lit in (Lit.make(var_), Lit.make(var_, True)):
+                reduced = _assign(clauses, lit)
+                if reduced is None:
+                    continue
+                remaining, assigned = reduced
+                # Variables that vanished without being assigned are free
+                free = num_vars - len(assigned) - len(_variables(remaining))
+                result += self.count(remaining) << free
+        self.cache[key] = result
+        return result
+
+
+def count_models(sat, projection=None):
+    '''
+    Returns the number of models of sat over its num_vars variables, or the
+    number of distinct projections onto projection if given. Projected
+    counting enumerates the projected models instead of using the cache.
+    '''
+    if projection is not None:
+        return sum(1 for _ in enumerate_models(sat, projection=projection))
+    clauses = [frozenset(clause.lits) for clause in sat.clauses[:sat.num_original]]
+    clauses.extend(frozenset([lit]) for lit in sat.units)
+    free = sat.num_vars - len(_variables(clauses))
+    # Branching recurses once per variable, on top of component splits
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 4 * sat.num_vars + 1000))
+    return ModelCounter().count(clauses) << free
@@ -0,0 +1,155 @@
+'''
+Portfolio solving: runs differently configured solvers on the same formula in
+parallel worker processes. The first worker to answer wins and the others are
+cancelled.
+
+Workers differ in branching heuristic, polarity, restart policy and seed, see
+CONFIGS. Beyond the last config, workers reuse them with new seeds.
+
+Optionally, workers share short learnt clauses through a ring buffer in shared
+memory. Each worker exports the glue clauses (LBD <= 2) it learns, and imports
+those of the others whenever it restarts, when it is back at the base level.
+'''
+import logging
+import multiprocessing
+from sat import SATSolver
+
+CONFIGS = [
+    {"heuristic": "vsids", "polarity": "save", "restart": "luby"},
+    {"heuristic": "vsids", "polarity": "save", "restart": "glucose"},
+    {"heuristic": "vsids", "polarity": "true", "restart": "geometric"},
+    {"heuristic": "jw", "polarity": "save", "restart": "luby"},
+    {"heuristic": "vsids", "polarity": "occurrence", "restart": "none"},
+    {"heuristic": "mom", "polarity": "save", "restart": "glucose"},
+]
+
+
+def worker_configs(workers):
+    '''
+    Returns the solver options of each of the given number of workers
+    '''
+    configs = []
+    for worker in range(workers):
+        config = dict(CONFIGS[worker % len(CONFIGS)])
+        # The first worker runs the plain default
+        config["seed"] = worker if worker > 0 else None
+        configs.append(config)
+    return configs
+
+
+class ClauseExchange():
+    '''
+    Ring buffer of ints in shared memory holding learnt clauses as records
+    [sender, length, lits...]. Writers append under a lock, and each reader
+    keeps its own cursor. A reader that falls more than a whole buffer behind
+    skips ahead, losing those clauses, which is harmless.
+    '''
+    SIZE = 1 << 16
+    MAX_LENGTH = 8  # Longer clauses are not worth sending
+
+    def __init__(self, ctx):
+        self.buffer = ctx.Array('i', self.SIZE, lock=False)
+        self.head = ctx.Value('q', 0, lock=False)  # Number of ints ever written
+        self.lock = ctx.Lock()
+
+    def export(self, sender, lits):
+        record = [sender, len(lits)] + list(lits)
+        with self.lock:
+            pos = self.head.value
+            for x in record:
+                self.buffer[pos % self.SIZE] = x
+                pos += 1
+            self.head.value = pos
+
+    def fetch(self, receiver, cursor):
+        '''
+        Returns (clauses, cursor) with the clauses sent by other workers since
+        cursor, and the cursor to continue from next time
+        '''
+        clauses = []
+        with self.lock:
+            head = self.head.value
+            if head - cursor > self.SIZE:
+                return clauses, head
+            while cursor < head:
+                sender = self.buffer[cursor % self.SIZE]
+                length = self.buffer[(cursor + 1) % self.SIZE]
+                if sender != receiver:
+                    clauses.append([self.buffer[(cursor + 2 + k) % self.SIZE]
+                                    for k in range(length)])
+                cursor += 2 + length
+        return clauses, cursor
+
+
+class SharingSolver(SATSolver):
+    '''
+    A SATSolver that exchanges glue clauses with the other workers
+    '''
+
+    def __init__(self, sat, exchange, worker, **options):
+        super().__init__(sat, **options)
+        self.exchange = exchange
+        self.worker = worker
+        self.cursor = 0
+        self.imported = 0
+
+    def on_learnt(self, learnt, lbd):
+        if lbd <= 2 and len(learnt) <= ClauseExchange.MAX_LENGTH:
+            self.exchange.export(self.worker, learnt)
+
+    def restart(self):
+        super().restart()
+        clauses, self.cursor = self.exchange.fetch(self.worker, self.cursor)
+        for lits in clauses:
+            self.add_clause(lits)
+            if not self.ok:
+                break
+        self.imported += len(clauses)
+
+
+def _work(sat, mode, config, worker, exchange, results):
+    '''
+    Entry point of a worker process, sends (worker, result, values) back
+    '''
+    try:
+        if exchange is None:
+            solver = SATSolver(sat, **config)
+        else:
+            solver = SharingSolver(sat, exchange, worker, **config)
+        result = solver.solve(mode)
+        results.put((worker, result, bytes(solver.assignments.values)))
+    except Exception as e:
+        results.put((worker, None, str(e)))
+
+
+def solve_portfolio(sat, workers, mode="cdcl", share=False):
+    '''
+    Solves sat with the given number of workers.
+
+    share:  exchange glue clauses between workers, only cdcl learns any
+
+    Returns (result, config, values), the answer of the first worker to finish,
+    its solver options, and its assignment values indexed by literal.
+    '''
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    exchange = ClauseExchange(ctx) if share else None
+    configs = worker_configs(workers)
+    processes = [ctx.Process(target=_work, daemon=True,
+                             args=(sat, mode, config, worker, exchange, results))
+                 for worker, config in enumerate(configs)]
+    for process in processes:
+        process.start()
+    try:
+        for _ in processes:
+            worker, result, values = results.get()
+            if result is not None:
+                logging.info(f"Worker {worker} answered first, with {configs[worker]}")
+                return result, configs[worker], bytearray(values)
+            logging.warning(f"Worker {worker} failed: {values}")
+        raise RuntimeError("Every portfolio worker failed")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
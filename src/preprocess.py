@@ -0,0 +1,315 @@
+'''
+Simplifies a formula before search, between the Loader and the SATSolver.
+
+Passes, each of which can be turned on and off:
+    units:      top-level unit propagation. Satisfied clauses are removed and
+                false literals are removed from the remaining clauses.
+    pure:       pure literal elimination. A variable occurring with one sign
+                only is set to that sign, satisfying all its clauses.
+    subsume:    subsumption and self-subsuming resolution. A clause that is a
+                superset of another is removed, and if C with one literal
+                negated is a subset of D, that literal is removed from D.
+    bve:        bounded variable elimination. A variable is eliminated by
+                replacing its clauses with all their resolvents on it, when
+                that does not increase the number of clauses.
+
+Duplicate literals and tautologies are already removed by the Loader.
+
+Fixed variables are kept in the simplified formula as unit clauses. Eliminated
+variables no longer appear in it, so the solver may give them any value;
+extend_model then fixes their values up to satisfy the original formula.
+
+With a proof writer, every change to the clauses is logged as a DRAT step, so
+that a proof of unsatisfiability of the simplified formula also covers the
+original one: strengthened clauses and resolvents are RUP, and pure literals
+are RAT.
+'''
+import logging
+from lib import Assn, Clause, SAT, UnsatException
+
+PASSES = ["units", "pure", "subsume", "bve"]
+
+
+def parse_passes(spec):
+    '''
+    Turns "all", "none" or a comma separated list of pass names into a list
+    '''
+    if spec == "all":
+        return list(PASSES)
+    if spec == "none":
+        return []
+    passes = spec.split(",")
+    for name in passes:
+        if name not in PASSES:
+            raise ValueError(f"Unknown preprocessing pass {name}")
+    return passes
+
+
+class Preprocessor():
+    '''
+    Simplifies the clauses of a SAT, which is left untouched.
+
+    sat:    the formula to simplify
+    passes: names of the passes to run, see PASSES. They always run in the
+            order of PASSES.
+    proof:  optional drat.ProofWriter to log the changes to
+    '''
+    # Variables with more occurrences than this of either sign are not eliminated,
+    # as the number of resolvents to try grows with the product of both
+    BVE_OCCURRENCE_LIMIT = 10
+
+    def __init__(self, sat, passes=PASSES, proof=None):
+        for name in passes:
+            assert name in PASSES, f"Unknown preprocessing pass {name}"
+        self.passes = passes
+        self.num_vars = sat.num_vars
+        # clauses[i] is a list of literals, None once removed
+        self.clauses = []
+        # occurs[lit] is the set of indices of the clauses containing lit
+        self.occurs = [set() for _ in range(2 * sat.num_vars + 2)]
+        # Literals made true at the top level, by unit propagation or purity
+        self.fixed = bytearray([Assn.UNKNOWN]) * (2 * sat.num_vars + 2)
+        self.units = []
+        # Unit clauses still to be propagated
+        self.queue = []
+        # (variable, clauses it occurred positively in) for every eliminated
+        # variable, in order of elimination
+        self.eliminated = []
+        # Not set before the input clauses are in, which need no proof
+        self.proof = None
+        for clause in sat.clauses[:sat.num_original]:
+            self._add(list(clause.lits))
+        for lit in sat.units:
+            self._add([lit])
+        self.proof = proof
+
+    def _add(self, lits):
+        '''
+        Adds a clause, returning its index
+        '''
+        if self.proof is not None:
+            self.proof.add(lits)
+        if not lits:
+            raise UnsatException("Preprocessing derived the empty clause")
+        idx = len(self.clauses)
+        self.clauses.append(lits)
+        for lit in lits:
+            self.occurs[lit].add(idx)
+        if len(lits) == 1:
+            self.queue.append(lits[0])
+        return idx
+
+    def _remove(self, idx):
+        # Unit clauses stay, the solver still needs them and checkers keep them anyway
+        if self.proof is not None and len(self.clauses[idx]) > 1:
+            self.proof.delete(self.clauses[idx])
+        for lit in self.clauses[idx]:
+            self.occurs[lit].discard(idx)
+        self.clauses[idx] = None
+
+    def _strengthen(self, idx, lit):
+        '''
+        Removes a literal that is false or redundant from a clause
+        '''
+        lits = self.clauses[idx]
+        if self.proof is not None:
+            self.proof.add([q for q in lits if q != lit])
+            self.proof.delete(lits)
+        lits.remove(lit)
+        self.occurs[lit].discard(idx)
+        if not lits:
+            raise UnsatException("Preprocessing derived the empty clause")
+        if len(lits) == 1:
+            self.queue.append(lits[0])
+
+    def _fix(self, lit):
+        '''
+        Makes lit true at the top level, simplifying every clause it occurs in
+        '''
+        self.fixed[lit] = Assn.TRUE
+        self.fixed[lit ^ 1] = Assn.FALSE
+        self.units.append(lit)
+        for idx in list(self.occurs[lit]):
+            self._remove(idx)
+        for idx in list(self.occurs[lit ^ 1]):
+            self._strengthen(idx, lit ^ 1)
+
+    def propagate(self):
+        '''
+        Top-level unit propagation over the queued unit clauses
+        '''
+        while self.queue:
+            lit = self.queue.pop()
+            if self.fixed[lit] == Assn.FALSE:
+                if self.proof is not None:
+                    self.proof.add([])
+                raise UnsatException("Preprocessing found conflicting units")
+            if self.fixed[lit] == Assn.UNKNOWN:
+                self._fix(lit)
+
+    def eliminate_pure(self):
+        '''
+        Fixes pure literals until there are none left, as removing the clauses
+        of one can make others pure
+        '''
+        occurs = self.occurs
+        candidates = range(1, self.num_vars + 1)
+        while candidates:
+            touched = set()
+            for v in candidates:
+                pos, neg = occurs[2 * v], occurs[2 * v + 1]
+                if bool(pos) == bool(neg):
+                    continue
+                lit = 2 * v if pos else 2 * v + 1
+                for idx in occurs[lit]:
+                    touched.update(q >> 1 for q in self.clauses[idx])
+                if self.proof is not None:
+                    # RAT, as no clause contains NOT lit
+                    self.proof.add([lit])
+                self._fix(lit)
+            candidates = sorted(touched)
+
+    def subsume(self):
+        '''
+        Removes subsumed clauses and strengthens clauses by self-subsuming
+        resolution, checking every clause against the others once, and again
+        whenever it is strengthened
+        '''
+        clauses = self.clauses
+        occurs = self.occurs
+        queue = sorted((idx for idx in range(len(clauses)) if clauses[idx] is not None),
+                       key=lambda idx: len(clauses[idx]), reverse=True)
+        while queue:
+            idx = queue.pop()
+            lits = clauses[idx]
+            if lits is None:
+                continue
+            # Every clause D that C subsumes or strengthens contains p or NOT p,
+            # so only look at the occurrences of the rarest variable of C
+            p = min(lits, key=lambda q: len(occurs[q]) + len(occurs[q ^ 1]))
+            for other in list(occurs[p]) + list(occurs[p ^ 1]):
+                if other == idx or clauses[other] is None:
+                    continue
+                other_lits = clauses[other]
+                if len(other_lits) < len(lits):
+                    continue
+                other_set = set(other_lits)
+                flipped = None
+                for q in lits:
+                    if q in other_set:
+                        continue
+                    if flipped is None and q ^ 1 in other_set:
+                        flipped = q
+                        continue
+                    break
+                else:
+                    if flipped is None:
+                        self._remove(other)
+                    else:
+                        self._strengthen(other, flipped ^ 1)
+                        queue.append(other)
+            if "units" in self.passes:
+                self.propagate()
+
+    def _resolve(self, pos_lits, neg_lits, var_):
+        '''
+        Returns the resolvent of two clauses on var_, or None if it is a tautology
+        '''
+        resolvent = [q for q in pos_lits if q >> 1 != var_]
+        seen = set(resolvent)
+        for q in neg_lits:
+            if q >> 1 == var_ or q in seen:
+                continue
+            if q ^ 1 in seen:
+                return None
+            resolvent.append(q)
+        return resolvent
+
+    def eliminate_vars(self):
+        '''
+        Bounded variable elimination, trying the variables with the fewest
+        occurrences first
+        '''
+        clauses = self.clauses
+        occurs = self.occurs
+        order = sorted(range(1, self.num_vars + 1),
+                       key=lambda v: len(occurs[2 * v]) + len(occurs[2 * v + 1]))
+        for v in order:
+            if self.fixed[2 * v] != Assn.UNKNOWN:
+                continue
+            pos, neg = list(occurs[2 * v]), list(occurs[2 * v + 1])
+            if not pos and not neg:
+                continue
+            if len(pos) > self.BVE_OCCURRENCE_LIMIT or len(neg) > self.BVE_OCCURRENCE_LIMIT:
+                continue
+            resolvents = []
+            for i in pos:
+                for j in neg:
+                    resolvent = self._resolve(clauses[i], clauses[j], v)
+                    if resolvent is not None:
+                        resolvents.append(resolvent)
+                        if len(resolvents) > len(pos) + len(neg):
+                            break
+                else:
+                    continue
+                break
+            if len(resolvents) > len(pos) + len(neg):
+                continue
+
+            self.eliminated.append((v, [list(clauses[i]) for i in pos]))
+            proof = self.proof
+            if proof is not None:
+                # Resolvents are only RUP while the clauses they come from exist
+                for resolvent in resolvents:
+                    proof.add(resolvent)
+            for idx in pos + neg:
+                self._remove(idx)
+            self.proof = None
+            try:
+                for resolvent in resolvents:
+                    self._add(resolvent)
+            finally:
+                self.proof = proof
+            if "units" in self.passes:
+                self.propagate()
+
+    def run(self):
+        '''
+        Runs the enabled passes, returning the simplified formula as a new SAT.
+        Raises UnsatException if the formula was found to be unsatisfiable.
+        '''
+        before = sum(1 for lits in self.clauses if lits is not None)
+        if "units" in self.passes:
+            self.propagate()
+        if "pure" in self.passes:
+            self.eliminate_pure()
+        if "subsume" in self.passes:
+            self.subsume()
+        if "bve" in self.passes:
+            self.eliminate_vars()
+
+        clauses = [Clause(lits) for lits in self.clauses if lits is not None]
+        logging.info(f"Preprocessing: {before} clauses to {len(clauses)}, "
+                     f"{len(self.units)} variables fixed, {len(self.eliminated)} eliminated")
+        clauses.extend(Clause([lit]) for lit in self.units)
+        return SAT(clauses, self.num_vars)
+
+    def extend_model(self, values):
+        '''
+        Extends a model of the simplified formula to one of the original formula,
+        by fixing up the values of eliminated variables, last eliminated first.
+
+        values: assignment values indexed by literal, as in Assignment.values,
+                updated in place
+        '''
+        for v, pos_clauses in reversed(self.eliminated):
+            # NOT v satisfies every clause v occurred negatively in. v is only
+            # needed if a clause it occurred positively in has nothing else true,
+            # and then the resolvents guarantee the negative ones are satisfied.
+            value = Assn.FALSE
+            for lits in pos_clauses:
+                if all(values[q] != Assn.TRUE for q in lits if q >> 1 != v):
+                    value = Assn.TRUE
+                    break
+            values[2 * v] = value
+            values[2 * v + 1] = Assn.neg(value)
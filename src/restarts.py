@@ -0,0 +1,183 @@
+'''
+Restart policies for CDCL search.
+
+A restart undoes every decision and starts the search again from the base
+level. Learnt clauses, heuristic activities and saved phases are all kept,
+so the solver does not redo the same work, but can escape a bad choice made
+early in the search.
+
+The solver tells the policy about every conflict, together with the LBD
+(literal block distance, the number of distinct decision levels) of the
+clause learnt from it. The policy then says whether to restart now.
+To add your own, subclass RestartPolicy and register it in RESTARTS, which
+also makes it selectable with --restart in sat.py.
+'''
+from collections import deque
+
+
+def luby(i):
+    '''
+    Returns the i-th element (from 0) of the Luby sequence 1 1 2 1 1 2 4 1 1 2 ...
+    '''
+    # Find the finite subsequence that contains index i, and its size
+    size, seq = 1, 0
+    while size < i + 1:
+        seq += 1
+        size = 2 * size + 1
+    while size - 1 != i:
+        size = (size - 1) >> 1
+        seq -= 1
+        i = i % size
+    return 1 << seq
+
+
+class RestartPolicy():
+    '''
+    Interface for deciding when to restart.
+
+    interval: number of conflicts the policy is scaled by, its exact meaning
+              depends on the policy
+    '''
+
+    def __init__(self, interval=100):
+        self.interval = interval
+
+    def on_conflict(self, lbd):
+        '''
+        Called after every conflict with the LBD of the learnt clause.
+        Returns True if the solver should restart now.
+        '''
+        return False
+
+    def on_restart(self):
+        '''
+        Called whenever the solver restarts
+        '''
+        pass
+
+    def state(self):
+        '''
+        Returns the state of the policy as a JSON-serializable dict, for checkpoints
+        '''
+        return {}
+
+    def restore(self, state):
+        '''
+        Continues from a state returned by state()
+        '''
+        pass
+
+
+class NoRestarts(RestartPolicy):
+    '''
+    Never restarts
+    '''
+    pass
+
+
+class ConflictLimitRestarts(RestartPolicy):
+    '''
+    Restarts once the number of conflicts since the last restart reaches a
+    limit, which is recomputed by next_limit after every restart
+    '''
+
+    def __init__(self, interval=100):
+        super().__init__(interval)
+        self.restarts = 0
+        self.conflicts = 0
+        self.limit = self.next_limit(0)
+
+    def next_limit(self, restarts):
+        raise NotImplementedError
+
+    def on_conflict(self, lbd):
+        self.conflicts += 1
+        return self.conflicts >= self.limit
+
+    def on_restart(self):
+        self.restarts += 1
+        self.conflicts = 0
+        self.limit = self.next_limit(self.restarts)
+
+    def state(self):
+        return {"restarts": self.restarts, "conflicts": self.conflicts}
+
+    def restore(self, state):
+        self.restarts = state["restarts"]
+        self.conflicts = state["conflicts"]
+        self.limit = self.next_limit(self.restarts)
+
+
+class LubyRestarts(ConflictLimitRestarts):
+    '''
+    Restarts after interval * luby(i) conflicts, the i-th time
+    '''
+
+    def next_limit(self, restarts):
+        return self.interval * luby(restarts)
+
+
+class GeometricRestarts(ConflictLimitRestarts):
+    '''
+    Restarts after interval * factor^i conflicts, the i-th time
+    '''
+    FACTOR = 1.5
+
+    def next_limit(self, restarts):
+        return self.interval * self.FACTOR ** restarts
+
+
+class GlucoseRestarts(RestartPolicy):
+    '''
+    Glucose-style dynamic restarts: compares the average LBD of the last
+    interval learnt clauses against the average over the whole search. If
+    recent clauses are clearly worse than usual, the search is probably in a
+    bad region and we restart.
+
+    interval: size of the window of recent LBDs, 50 in glucose
+    '''
+    K = 0.8
+
+    def __init__(self, interval=50):
+        super().__init__(interval)
+        self.recent = deque(maxlen=interval)
+        self.recent_sum = 0
+        self.total_sum = 0
+        self.total_count = 0
+
+    def on_conflict(self, lbd):
+        if len(self.recent) == self.recent.maxlen:
+            self.recent_sum -= self.recent[0]
+        self.recent.append(lbd)
+        self.recent_sum += lbd
+        self.total_sum += lbd
+        self.total_count += 1
+        if len(self.recent) < self.recent.maxlen:
+            return False
+        recent_avg = self.recent_sum / len(self.recent)
+        total_avg = self.total_sum / self.total_count
+        return recent_avg * self.K > total_avg
+
+    def on_restart(self):
+        self.recent.clear()
+        self.recent_sum = 0
+
+    def state(self):
+        return {"recent": list(self.recent), "total_sum": self.total_sum,
+                "total_count": self.total_count}
+
+    def restore(self, state):
+        self.recent.clear()
+        self.recent.extend(state["recent"])
+        self.recent_sum = sum(self.recent)
+        self.total_sum = state["total_sum"]
+        self.total_count = state["total_count"]
+
+
+# Restart policies selectable by name
+RESTARTS = {
+    "none": NoRestarts,
+    "luby": LubyRestarts,
+    "geometric": GeometricRestarts,
+    "glucose": GlucoseRestarts,
+}
@@ -1,114 +1,566 @@
 #!/usr/bin/env python3
 
-import re
+import os
+import sys
+import time
+import random
 import logging
 import argparse
-from loader import Loader
-from lib import Variable, Assn, Var, Clause, SAT, UnsatException, VARIABLES
-from typing import List
+from loader import Loader, ParseError
+from cache import FormulaCache
+from lib import Assn, Lit, Clause, UnsatException
 from assignment import Assignment
-from heuristics import choose_assn
+from heuristics import HEURISTICS, POLARITIES
+from restarts import RESTARTS
+from preprocess import Preprocessor, parse_passes
+from tracer import Tracer
+from stats import Stats, SamplingProfiler, profile
+from sls import LOCAL_SEARCH
+from drat import ProofWriter
+from checkpoint import Checkpointer, Preempted, load as load_checkpoint, restore as restore_checkpoint
+
+# How often to check invariants: "off", "incremental" (only clauses touched
+# since the last check) or "full". Mainly for debugging purposes.
+INVARIANT_MODES = ["off", "incremental", "full"]
+DEFAULT_INVARIANTS = os.environ.get("SAT_INVARIANTS", "off")
+# Exit statuses of SAT competition solvers
+EXIT_SAT = 10
+EXIT_UNSAT = 20
+
+
+def parse_projection(spec):
+    '''
+    Turns a comma separated list of variable labels into a list of ints
+    '''
+    try:
+        labels = [int(v) for v in spec.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{spec!r} is not a comma separated list of variables")
+    for label in labels:
+        if label <= 0:
+            raise argparse.ArgumentTypeError(f"{label} is not a variable, labels start at 1")
+    return labels
+
+
+def model_lines(values, num_vars, width=78):
+    '''
+    Returns the model in values, indexed by literal as in Assignment.values, as
+    SAT competition "v" lines of DIMACS literals, terminated by 0
+    '''
+    lines = []
+    line = ["v"]
+    length = 1
+    for label in range(1, num_vars + 1):
+        num = str(label if values[2 * label] == Assn.TRUE else -label)
+        if length + 1 + len(num) > width:
+            lines.append(" ".join(line))
+            line = ["v"]
+            length = 1
+        line.append(num)
+        length += 1 + len(num)
+    line.append("0")
+    lines.append(" ".join(line))
+    return lines
 
 
 class SATSolver():
-    def __init__(self, sat):
-        self.assignments = Assignment(VARIABLES, sat)
+    # Learnt clauses are reduced after FIRST_REDUCE conflicts, and then after
+    # each REDUCE_INCREMENT more conflicts than the previous interval (glucose)
+    FIRST_REDUCE = 2000
+    REDUCE_INCREMENT = 300
+
+    def __init__(self, sat, heuristic="vsids", polarity="save", invariants=DEFAULT_INVARIANTS,
+                 tracer=None, restart="luby", restart_interval=None, seed=None,
+                 progress=None, progress_interval=10.0):
+        '''
+        heuristic:  name of the branching heuristic to use, see heuristics.HEURISTICS
+        polarity:   name of the polarity heuristic to use, see heuristics.POLARITIES
+        invariants: how often to check invariants during search, see INVARIANT_MODES
+        tracer:     optional tracer.Tracer to send structured search events to
+        restart:    name of the restart policy used by CDCL, see restarts.RESTARTS
+        restart_interval: number of conflicts the restart policy is scaled by,
+                    None for the policy's own default
+        seed:       if given, randomizes the initial variable order with this seed
+        progress:   optional function called with self.stats during search, at most
+                    once every progress_interval seconds
+        '''
+        assert invariants in INVARIANT_MODES, f"Unknown invariant mode {invariants}"
+        # Kept for checkpoint.config, which only resumes the same configuration
+        self.seed = seed
+        self.restart_interval = restart_interval
+        self.heuristic = HEURISTICS[heuristic](sat.num_vars, sat)
+        self.polarity = POLARITIES[polarity](sat.num_vars, sat)
+        if seed is not None:
+            self.heuristic.randomize(random.Random(seed))
+        if restart_interval is None:
+            self.restart_policy = RESTARTS[restart]()
+        else:
+            self.restart_policy = RESTARTS[restart](restart_interval)
+        self.stats = Stats()
+        self.assignments = Assignment(sat, self.heuristic, self.polarity, self.stats)
         self.sat = sat
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.next_progress = self.stats.start + progress_interval
+        self.reduce_interval = self.FIRST_REDUCE
+        self.next_reduce = self.FIRST_REDUCE
+        self.tracer = tracer
+        self.assignments.tracer = tracer
+        # False once the formula itself is known to be unsatisfiable
+        self.ok = True
+        # Literals assumed true for the current call to solve, and those of
+        # them that made it unsatisfiable (None unless that is the reason)
+        self.assumptions = []
+        self.core = None
+        # Optional checkpoint.Checkpointer, and the trail of a checkpoint being
+        # resumed, see checkpoint.restore
+        self.checkpointer = None
+        self.resume_trail = None
+        # Optional drat.ProofWriter, which every learnt and deleted clause is
+        # logged to, and the empty clause when the formula is unsatisfiable
+        self.proof = None
+
+        # Checked once, so that per-decision messages cost nothing when not shown
+        self.verbose = logging.getLogger().isEnabledFor(logging.INFO)
+
+        self.invariants = invariants
+        self.paranoid = invariants != "off"
+        if invariants == "incremental":
+            # Everything counts as touched before the first check
+            self.assignments.touched = set(range(len(sat.clauses)))
+
+    def solve(self, mode="dpll", assumptions=()):
+        '''
+        Runs the search algorithm named by mode, either "dpll" or "cdcl".
+        Returns True if the formula is satisfiable, else False.
+
+        solve can be called again, after adding clauses and variables, and
+        keeps everything learnt by earlier calls.
+
+        assumptions: literals that must be true for this call only, cdcl only.
+                     If they make the formula unsatisfiable, the ones
+                     responsible are left in self.core.
+        '''
+        assert mode == "cdcl" or not assumptions, "Only cdcl supports assumptions"
+        self.assignments.backjump(0)
+        self.assumptions = list(assumptions)
+        self.core = None
+        if not self.ok or not self.assignments.assign_units():
+            result = False
+        else:
+            if self.resume_trail is not None:
+                self.replay(self.resume_trail)
+                self.resume_trail = None
+            if mode == "cdcl":
+                result = self.cdcl()
+            else:
+                result = self.dpll()
+        if not result and self.core is None:
+            if self.ok and self.proof is not None:
+                self.proof.add([])
+            self.ok = False
+        if self.tracer is not None:
+            self.tracer.result(result)
+        return result
+
+    def replay(self, levels):
+        '''
+        Rebuilds the trail of a checkpoint: levels holds, for every decision
+        level, its decision and the literals assigned there without a reason
+        '''
+        assignments = self.assignments
+        for level, (decision, forced) in enumerate(levels):
+            if level > 0:
+                if assignments.get_assignment_val(decision) != Assn.UNKNOWN:
+                    raise ValueError("Checkpoint trail does not match the formula")
+                assignments.create_decision_level(decision)
+            for lit in forced:
+                value = assignments.get_assignment_val(lit)
+                if value == Assn.FALSE:
+                    raise ValueError("Checkpoint trail does not match the formula")
+                if value == Assn.UNKNOWN:
+                    assignments.assign(lit)
+            if assignments.unit_propagation() < 0:
+                raise ValueError("Checkpoint trail does not match the formula")
 
-    def check_invariants(self):
+    def new_var(self):
+        '''
+        Adds a variable to the formula between calls to solve, returning its label
+        '''
+        var_ = self.sat.new_var()
+        self.assignments.new_var()
+        return var_
+
+    def add_clause(self, lits):
+        '''
+        Adds a clause to the formula between calls to solve. Literals that are
+        false at the base level are left out, and clauses that are already
+        satisfied there are not added at all.
+        '''
+        self.assignments.backjump(0)
+        values = self.assignments.values
+        lits = list(dict.fromkeys(lits))
+        seen = set(lits)
+        if any(values[lit] == Assn.TRUE or lit ^ 1 in seen for lit in lits):
+            return
+        lits = [lit for lit in lits if values[lit] != Assn.FALSE]
+        if not lits:
+            self.ok = False
+            return
+        cref = self.sat.add_clause(Clause(lits))
+        if cref < 0:
+            # Assigned right away, so that it also holds when added mid-search
+            self.assignments.assign(lits[0])
+        elif self.assignments.touched is not None:
+            self.assignments.touched.add(cref)
+
+    def run_invariant_checks(self):
+        '''
+        Checks invariants according to the invariant mode, called during search
+        only when self.paranoid is set
+        '''
+        if self.invariants == "full":
+            self.check_invariants()
+        else:
+            touched = self.assignments.touched
+            self.assignments.touched = set()
+            self.check_invariants(touched)
+
+    def check_invariants(self, crefs=None):
         '''
         Checking that we don't have any clause that is already unsatisfiable
         Mainly for debugging purposes
+
+        crefs: only check these clauses and the watch lists of their literals,
+               defaults to checking every clause and literal
         '''
-        for clause in self.sat.clauses:
+        clauses = self.sat.clauses
+        watches = self.sat.watches
+        if crefs is None:
+            crefs = range(len(clauses))
+            lits = range(2, 2 * self.sat.num_vars + 2)
+        else:
+            lits = {lit for cref in crefs if clauses[cref] is not None
+                    for lit in clauses[cref].lits}
+
+        for cref in crefs:
+            clause = clauses[cref]
+            if clause is None:
+                continue  # Deleted learnt clause
             num_false = 0
             # Check not all assignments false
-            for var_ in clause.vars:
-                if self.assignments.get_assignment_val(var_) == Assn.FALSE:
+            for lit in clause.lits:
+                if self.assignments.get_assignment_val(lit) == Assn.FALSE:
                     num_false += 1
-            assert num_false < len(clause.vars), "Invariants broken, clause:" + clause.pp(self.assignments)
+            assert num_false < len(clause.lits), "Invariants broken, clause:" + clause.pp(self.assignments)
 
             both_false = True
             # Check that watched by and watching is consistent
-            for watch_idx in clause.watchlist:
-                var_ = clause.vars[watch_idx]
-                assert var_.watchedBy.count(clause) >= 1, "watchedBy inconsistent with watchlist"
+            for lit in clause.lits[:2]:
+                assert cref in watches[lit], "Watch lists inconsistent with watched literals"
 
                 # Check that what we are watching is not both false
-                both_false &= self.assignments.get_assignment_val(var_) == Assn.FALSE
+                both_false &= self.assignments.get_assignment_val(lit) == Assn.FALSE
 
             assert not both_false, "Cannot be watching both literals false: " + clause.pp(self.assignments)
 
-        def check_watched_by(var_):
-            for clause in var_.watchingClauses():
-                var1 = clause.vars[clause.watchlist[0]] 
-                var2 = clause.vars[clause.watchlist[1]] 
-                assert var1 == var_ or var2 == var_, "Watchlist/watched by invariants broken"
-            pass
-
         # Check that watched by and watching is consistent
-        for variable in VARIABLES.values():
-            posVar = variable.getPos()
-            negVar = variable.getNeg()
-            check_watched_by(posVar)
-            check_watched_by(negVar)
+        for lit in lits:
+            for cref in watches[lit]:
+                assert lit in clauses[cref].lits[:2], "Watchlist/watched by invariants broken"
 
 
     def dpll(self):
-        while self.assignments.num_unassigned() > 0:
+        '''
+        Classic DPLL with chronological backtracking.
+        Returns True if the formula is satisfiable, else False.
+        '''
+        while True:
             if self.assignments.unit_propagation() < 0:
-                print("UNSATISFIABLE")
-                return
+                return False
 
-            self.check_invariants()
+            if self.paranoid:
+                self.run_invariant_checks()
+
+            if self.assignments.num_unassigned() == 0:
+                break
+
+            if self.checkpointer is not None and self.checkpointer.due():
+                self.checkpointer.save(self)
 
             # Choose a variable to assign
             var_ = self.assignments.get_unassigned_var()
 
-            # Try setting true first
-            assn = Assn.TRUE
-            try:
-                assn = choose_assn(var_, self.assignments.assignment_stack[-1][0], self.sat)
-            except NotImplementedError:
-                pass
+            lit = self.assignments.get_unassigned_lit(var_)
 
-            logging.info("Trying " + repr(var_) + ": " + Assn.toStr(assn))
-            self.assignments.create_decision_level(var_, Assn.TRUE)
-            logging.debug(
-                f"Assignment stack size: {len(self.assignments.assignment_stack)}")
+            if self.verbose:
+                logging.info("Trying %s", Lit.toStr(lit))
+            self.stats.decisions += 1
+            self.assignments.create_decision_level(lit)
+            if self.assignments.debug:
+                logging.debug("Decision level: %d", self.assignments.decision_level())
 
             # Backtrack until we can unit propagate without conflicts
             while self.assignments.unit_propagation() < 0:
                 # If there are conflicts, backtrack and set the previous
-                # variable to false
-                logging.info("Backtracking...")
-                if len(self.assignments.assignment_stack) <= 1:
+                # variable to the opposite value
+                if self.verbose:
+                    logging.info("Backtracking...")
+                self.stats.conflicts += 1
+                if self.progress is not None:
+                    self.report_progress()
+                for lit in self.sat.clauses[self.assignments.conflict].lits:
+                    self.heuristic.bump(lit >> 1)
+                self.heuristic.decay()
+                if self.assignments.decision_level() == 0:
                     # Out of options
-                    print("UNSATISFIABLE")
-                    return
+                    return False
+                if self.proof is not None:
+                    # No branch below the current decisions has a model, and
+                    # unit propagation shows it given the earlier such clauses
+                    trail = self.assignments.trail
+                    self.proof.add([trail[lim] ^ 1 for lim in self.assignments.trail_lim])
+
+                conflict_lit = self.assignments.backtrack()
+
+                if self.assignments.debug:
+                    logging.debug("Decision level: %d", self.assignments.decision_level())
+
+                if self.paranoid:
+                    self.run_invariant_checks()
+
+                if self.verbose:
+                    logging.info("Trying %s", Lit.toStr(conflict_lit ^ 1))
+                self.assignments.assign(conflict_lit ^ 1)
+
+        return True
+
+    def on_learnt(self, learnt, lbd):
+        '''
+        Called with every clause learnt by cdcl, before it is added. Does
+        nothing, subclasses can use it to pass learnt clauses on.
+        '''
+        pass
 
-                conflict_var = self.assignments.assignment_stack[-1][1]
-                old_conflict_assn = self.assignments.get_assignment_val(conflict_var.getPos())
-                assert old_conflict_assn != Assn.UNKNOWN
-                new_conflict_assn = Assn.neg(old_conflict_assn)
-                self.assignments.backtrack()
+    def report_progress(self):
+        '''
+        Calls the progress function if progress_interval has passed since the last time
+        '''
+        now = time.perf_counter()
+        if now >= self.next_progress:
+            self.next_progress = now + self.progress_interval
+            self.progress(self.stats)
 
-                logging.debug(
-                    f"Assignment stack size: {len(self.assignments.assignment_stack)}")
+    def restart(self):
+        '''
+        Undoes every decision, keeping learnt clauses and heuristic state
+        '''
+        logging.info("Restarting...")
+        self.stats.restarts += 1
+        self.assignments.backjump(0)
+        self.restart_policy.on_restart()
 
-                self.check_invariants()
+    def reduce_db(self):
+        '''
+        Deletes the less useful half of the learnt clauses, so that memory and
+        propagation cost stay bounded however long the search runs
+        '''
+        if self.proof is not None:
+            before = [(cref, self.sat.clauses[cref]) for cref in self.sat.learnts]
+        deleted = self.sat.reduce_learnts(self.assignments.locked)
+        if self.proof is not None:
+            for cref, clause in before:
+                if self.sat.clauses[cref] is not clause:
+                    self.proof.delete(clause.lits)
+        self.stats.reductions += 1
+        self.stats.deleted += deleted
+        self.reduce_interval += self.REDUCE_INCREMENT
+        self.next_reduce = self.stats.conflicts + self.reduce_interval
+        logging.info("Reduced learnt clauses, deleted %d, kept %d",
+                     deleted, len(self.sat.learnts))
 
-                logging.info("Trying " + repr(conflict_var) + ": " + Assn.toStr(new_conflict_assn))
-                self.assignments.assign(conflict_var, new_conflict_assn)
+    def cdcl(self):
+        '''
+        Conflict-driven clause learning: every conflict is analyzed to learn a
+        clause that prevents it from happening again, and we then backjump
+        non-chronologically to the level where the learnt clause becomes unit.
+        Returns True if the formula is satisfiable, else False.
+        '''
+        while True:
+            if self.assignments.unit_propagation() < 0:
+                self.stats.conflicts += 1
+                if self.progress is not None:
+                    self.report_progress()
+                if self.assignments.decision_level() == 0:
+                    return False
 
-        print("SATISFIABLE")
-        logging.info(self.assignments)
+                learnt, level = self.assignments.analyze_conflict()
+                lbd = self.assignments.compute_lbd(learnt)
+                self.heuristic.decay()
+                self.sat.decay_clauses()
+                if self.assignments.debug:
+                    logging.debug("Learnt %s, backjumping to level %d",
+                                  [Lit.toStr(lit) for lit in learnt], level)
+                if self.tracer is not None:
+                    self.tracer.learn(learnt, level)
+                self.on_learnt(learnt, lbd)
+                if self.proof is not None:
+                    self.proof.add(learnt)
+                self.stats.learnt += 1
+                self.assignments.backjump(level)
+
+                # learnt[0] is false in the conflict, so make it true instead
+                reason = -1
+                if len(learnt) > 1:
+                    reason = self.sat.add_learnt(learnt, lbd)
+                    if self.assignments.touched is not None:
+                        self.assignments.touched.add(reason)
+                self.assignments.assign(learnt[0], reason)
+
+                if self.restart_policy.on_conflict(lbd):
+                    self.restart()
+                    if not self.ok:
+                        return False
+                if self.stats.conflicts >= self.next_reduce:
+                    self.reduce_db()
+                continue
+
+            if self.paranoid:
+                self.run_invariant_checks()
+
+            # Decision level i + 1 belongs to assumption i
+            level = self.assignments.decision_level()
+            if level < len(self.assumptions):
+                lit = self.assumptions[level]
+                value = self.assignments.get_assignment_val(lit)
+                if value == Assn.TRUE:
+                    self.assignments.create_empty_level()
+                elif value == Assn.FALSE:
+                    self.core = self.assignments.analyze_final(lit)
+                    return False
+                else:
+                    self.stats.decisions += 1
+                    self.assignments.create_decision_level(lit)
+                continue
+
+            if self.assignments.num_unassigned() == 0:
+                break
+
+            if self.checkpointer is not None and self.checkpointer.due():
+                self.checkpointer.save(self)
+
+            # Choose a variable to assign
+            var_ = self.assignments.get_unassigned_var()
+
+            lit = self.assignments.get_unassigned_lit(var_)
+
+            if self.verbose:
+                logging.info("Trying %s", Lit.toStr(lit))
+            self.stats.decisions += 1
+            self.assignments.create_decision_level(lit)
+
+        return True
 
 if __name__ == '__main__':
+    # These build on SATSolver, so they can only be imported once this
+    # module is fully loaded
+    from models import enumerate_models, count_models
+    from portfolio import solve_portfolio
+    from cubes import solve_cubes
+
     parser = argparse.ArgumentParser()
     parser.add_argument("-v", "--verbosity", help="increase output verbosity", action="count")
-    parser.add_argument('files', metavar='f', type=str, nargs=1,
-                    help='CNF file to test for satisfiability')
+    parser.add_argument("-m", "--mode", choices=["dpll", "cdcl", "sls"], default="dpll",
+                    help="search algorithm: classic DPLL with chronological backtracking, "
+                    "conflict-driven clause learning with backjumping, or stochastic "
+                    "local search, which cannot prove unsatisfiability")
+    parser.add_argument("--heuristic", choices=sorted(HEURISTICS), default="vsids",
+                    help="branching heuristic used to choose the splitting variable")
+    parser.add_argument("--polarity", choices=sorted(POLARITIES), default="save",
+                    help="value to try first for the splitting variable")
+    parser.add_argument("--restart", choices=sorted(RESTARTS), default="luby",
+                    help="restart policy, only used by cdcl")
+    parser.add_argument("--restart-interval", type=int, default=None,
+                    help="number of conflicts the restart policy is scaled by: the luby unit, "
+                    "the first geometric interval, or the glucose LBD window")
+    parser.add_argument("--preprocess", type=parse_passes, default="all", metavar="PASSES",
+                    help="simplify the formula before search with these passes, comma "
+                    "separated: units, pure, subsume, bve. Or all (the default), or none")
+    parser.add_argument("--cache", metavar="DIR", default=None,
+                    help="keep parsed formulas in binary form in DIR, keyed by a hash of "
+                    "the file, and load them from there on later runs")
+    parser.add_argument("--enumerate", action="store_true",
+                    help="print the models as DIMACS literals, one model per line, instead "
+                    "of solving. Skips preprocessing.")
+    parser.add_argument("--limit", type=int, default=None, metavar="N",
+                    help="stop --enumerate after the first N models (default: all of them)")
+    parser.add_argument("--count", action="store_true",
+                    help="print the number of models instead of solving. Skips preprocessing.")
+    parser.add_argument("--project", type=parse_projection,
+                    default=None, metavar="VARS",
+                    help="comma separated variables to project --enumerate and --count onto")
+    parser.add_argument("--seed", type=int, default=None,
+                    help="randomize the initial variable order, or seed local search")
+    parser.add_argument("--sls", choices=sorted(LOCAL_SEARCH), default="probsat",
+                    help="local search algorithm for -m sls and --sls-first")
+    parser.add_argument("--sls-first", action="store_true",
+                    help="try local search before the search selected by --mode")
+    parser.add_argument("--noise", type=float, default=None,
+                    help="walksat random walk probability (default 0.567), or the probsat "
+                    "cb exponent (default 2.38)")
+    parser.add_argument("--max-flips", type=int, default=100000,
+                    help="flips per local search try (default: 100000)")
+    parser.add_argument("--max-tries", type=int, default=None,
+                    help="local search tries, each from a new random assignment "
+                    "(default: 10, or 1 with --sls-first)")
+    parser.add_argument("--portfolio", type=int, default=None, metavar="N",
+                    help="race N differently configured solvers in parallel processes, "
+                    "the first answer wins. Overrides --heuristic, --polarity, --restart "
+                    "and --seed.")
+    parser.add_argument("--share", action="store_true",
+                    help="let --portfolio workers exchange short learnt clauses (cdcl only)")
+    parser.add_argument("--cubes", type=int, default=None, metavar="DEPTH",
+                    help="cube-and-conquer: split the formula into up to 2^DEPTH cubes by "
+                    "lookahead and solve them in parallel with cdcl")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                    help="number of processes solving cubes (default: number of cores)")
+    parser.add_argument("--invariants", choices=INVARIANT_MODES, default=DEFAULT_INVARIANTS,
+                    help="check solver invariants during search, for debugging. "
+                    "incremental only checks clauses touched since the last check. "
+                    "Defaults to $SAT_INVARIANTS, or off")
+    parser.add_argument("--trace", metavar="FILE", default=None,
+                    help="write a JSON line per search event (decide, assign, conflict, "
+                    "learn, backtrack) to FILE, - for stderr")
+    parser.add_argument("--stats", action="store_true",
+                    help="print search statistics as DIMACS comment lines after each file")
+    parser.add_argument("--progress", type=float, default=None, metavar="SECONDS",
+                    help="print a statistics line every SECONDS during search")
+    parser.add_argument("--profile", choices=["cprofile", "sample"], default=None,
+                    help="profile each search: cprofile prints the functions with the most "
+                    "cumulative time, sample periodically samples the stack, which is "
+                    "much cheaper. Reports go to stderr.")
+    parser.add_argument("--profile-out", metavar="FILE", default=None,
+                    help="save the cprofile profile to FILE instead, for pstats or snakeviz")
+    parser.add_argument("--checkpoint", metavar="FILE", default=None,
+                    help="save the search state of dpll or cdcl to FILE periodically, and "
+                    "on SIGTERM, after which the solver stops. Needs a single input file, and "
+                    "no --portfolio, --cubes, --enumerate or --count.")
+    parser.add_argument("--checkpoint-interval", type=float, default=300.0, metavar="SECONDS",
+                    help="time between checkpoints (default: 300)")
+    parser.add_argument("--resume", action="store_true",
+                    help="continue from the --checkpoint file if it exists, so that the same "
+                    "command can be rerun until the search finishes")
+    parser.add_argument("--proof", metavar="FILE", default=None,
+                    help="write a DRAT proof to FILE, covering preprocessing and search, "
+                    "which proves an UNSATISFIABLE answer. Check it with drat.py or "
+                    "drat-trim. Needs a single input file and dpll or cdcl.")
+    parser.add_argument("--binary-proof", action="store_true",
+                    help="write the proof in the binary DRAT format")
+    parser.add_argument('files', metavar='f', type=str, nargs='+',
+                    help='CNF files to test for satisfiability, optionally gzip/xz/bzip2 '
+                    'compressed, or - for stdin. Each file is solved in turn. With a '
+                    'single file, the exit status is 10 if satisfiable and 20 if not, '
+                    'as in the SAT competition.')
     args = parser.parse_args()
     if args.verbosity == 2:
         logging.basicConfig(level=logging.DEBUG)
@@ -117,8 +569,160 @@ if __name__ == '__main__':
     else:
         logging.basicConfig(level=logging.WARN)
 
-    print(args.files[0])
-    sat = Loader.load_file(args.files[0])
-    logging.info(sat)
-    sat_solver = SATSolver(sat)
-    sat_solver.dpll()
\ No newline at end of file
+    if args.limit is not None and not args.enumerate:
+        parser.error("--limit needs --enumerate")
+    if args.checkpoint and (len(args.files) > 1 or args.mode == "sls" or args.portfolio
+                            or args.cubes is not None or args.enumerate or args.count):
+        parser.error("--checkpoint needs a single input file, dpll or cdcl, and no "
+                     "--portfolio, --cubes, --enumerate or --count")
+    if args.resume and not args.checkpoint:
+        parser.error("--resume needs --checkpoint")
+    if args.proof and (len(args.files) > 1 or args.mode == "sls" or args.portfolio
+                       or args.cubes is not None or args.enumerate
+                       or args.count or args.resume):
+        parser.error("--proof needs a single input file, dpll or cdcl, and no --portfolio, "
+                     "--cubes, --enumerate, --count or --resume")
+
+    tracer = None
+    if args.trace is not None:
+        tracer = Tracer(sys.stderr if args.trace == "-" else open(args.trace, "w"))
+
+    status = 0
+    cache = FormulaCache(args.cache) if args.cache else None
+    proof = ProofWriter(args.proof, args.binary_proof) if args.proof else None
+    answers = []
+    try:
+        for location in args.files:
+            print(f"c {location}")
+            try:
+                sat = cache.load_file(location) if cache else Loader.load_file(location)
+            except ParseError as e:
+                print(f"{location}: {e}", file=sys.stderr)
+                status = 1
+                continue
+            except UnsatException as e:
+                # The input has an empty clause
+                logging.info(f"{location}: {e}")
+                if args.count:
+                    print(0)
+                elif args.enumerate:
+                    print("0 models")
+                else:
+                    if proof is not None:
+                        proof.add([])
+                    print("s UNSATISFIABLE")
+                    answers.append(False)
+                continue
+            logging.info("%s", sat)
+            original = sat
+            if args.project and max(args.project) > sat.num_vars:
+                parser.error(f"argument --project: variable {max(args.project)} is not in "
+                             f"{location}, which has {sat.num_vars} variables")
+            if args.count:
+                print(count_models(sat, args.project))
+                continue
+            if args.enumerate:
+                num_models = 0
+                for model in enumerate_models(sat, args.limit, args.project,
+                                              heuristic=args.heuristic, polarity=args.polarity,
+                                              restart=args.restart):
+                    print(" ".join(map(str, model)))
+                    num_models += 1
+                print(f"{num_models} models")
+                continue
+            if tracer is not None:
+                tracer.start(location)
+            preprocessor = Preprocessor(sat, args.preprocess, proof)
+            try:
+                sat = preprocessor.run()
+            except UnsatException:
+                if tracer is not None:
+                    tracer.result(False)
+                print("s UNSATISFIABLE")
+                answers.append(False)
+                continue
+            sat_solver = searcher = result = None
+            if args.mode == "sls" or args.sls_first:
+                searcher = LOCAL_SEARCH[args.sls](sat, args.noise, args.seed)
+                max_tries = args.max_tries or (1 if args.sls_first else 10)
+                if searcher.solve(args.max_flips, max_tries):
+                    result, values = True, searcher.values
+                elif args.mode == "sls":
+                    print("s UNKNOWN")
+                    if args.stats:
+                        print(f"c flips {searcher.flips}\nc tries {searcher.tries}")
+                    continue
+            if result is not None:
+                logging.info(f"Local search found a model after {searcher.flips} flips")
+            elif args.portfolio:
+                result, config, values = solve_portfolio(sat, args.portfolio, args.mode, args.share)
+            elif args.cubes is not None:
+                def report(refuted, total):
+                    print(f"Refuted {refuted}/{total} cubes", file=sys.stderr)
+                result, values = solve_cubes(sat, args.cubes, args.jobs, report,
+                                             heuristic=args.heuristic, polarity=args.polarity,
+                                             restart=args.restart)
+            else:
+                progress = None
+                if args.progress is not None:
+                    progress = lambda stats: print(stats.progress_line(), flush=True)
+                sat_solver = SATSolver(sat, args.heuristic, args.polarity, args.invariants, tracer,
+                                       args.restart, args.restart_interval, args.seed,
+                                       progress, args.progress or 10.0)
+                sat_solver.proof = proof
+                if args.checkpoint:
+                    sat_solver.checkpointer = Checkpointer(args.checkpoint, args.mode,
+                                                           args.checkpoint_interval)
+                    if args.resume and os.path.exists(args.checkpoint):
+                        try:
+                            restore_checkpoint(sat_solver, args.mode, load_checkpoint(args.checkpoint))
+                        except ValueError as e:
+                            print(f"{args.checkpoint}: {e}", file=sys.stderr)
+                            status = 1
+                            continue
+                        print(f"c resuming from {args.checkpoint}")
+                try:
+                    if args.profile == "cprofile":
+                        result = profile(lambda: sat_solver.solve(args.mode), args.profile_out)
+                    elif args.profile == "sample":
+                        sampler = SamplingProfiler()
+                        sampler.start()
+                        try:
+                            result = sat_solver.solve(args.mode)
+                        finally:
+                            sampler.stop()
+                        print("\n".join(sampler.lines()), file=sys.stderr)
+                    else:
+                        result = sat_solver.solve(args.mode)
+                except Preempted:
+                    print(f"c search state saved to {args.checkpoint}")
+                    print("s UNKNOWN")
+                    continue
+                values = sat_solver.assignments.values
+            if result:
+                preprocessor.extend_model(values)
+                # Never report a model that does not satisfy the input formula
+                if original.satisfied_by(values):
+                    print("s SATISFIABLE")
+                    print("\n".join(model_lines(values, original.num_vars)))
+                    answers.append(True)
+                else:
+                    print(f"{location}: model does not satisfy the formula", file=sys.stderr)
+                    print("s UNKNOWN")
+                    status = 1
+            else:
+                print("s UNSATISFIABLE")
+                answers.append(False)
+            if args.stats and searcher is not None:
+                print(f"c flips {searcher.flips}\nc tries {searcher.tries}")
+            if args.stats and sat_solver is not None:
+                print("\n".join(sat_solver.stats.lines()))
+    finally:
+        # Also on errors and interrupts, so that no trace or proof is cut short
+        if tracer is not None:
+            tracer.close()
+        if proof is not None:
+            proof.close()
+    if status == 0 and len(args.files) == 1 and answers:
+        status = EXIT_SAT if answers[0] else EXIT_UNSAT
+    sys.exit(status)
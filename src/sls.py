@@ -0,0 +1,207 @@
+'''
+Stochastic local search: incomplete, but on large satisfiable random formulas
+it finds models far faster than DPLL or CDCL.
+
+Local search starts from a random full assignment and flips one variable at a
+time, picked from a random unsatisfied clause. It can never prove a formula
+unsatisfiable, so it gives up after a budget of flips and tries.
+
+Both algorithms keep the same incremental state, so every flip only touches
+the clauses the flipped variable occurs in:
+    num_true[c]:    number of true literals of clause c
+    true_xor[c]:    XOR of the true literals of c, which is the only true
+                    literal when num_true[c] == 1
+    breaks[v]:      clauses that flipping v would make unsatisfied, i.e. where
+                    the literal of v is the only true one
+    makes[v]:       unsatisfied clauses that flipping v would satisfy
+    unsat:          unsatisfied clauses, with unsat_pos[c] the position of c in
+                    it, so adding and removing one is O(1)
+
+To add an algorithm, subclass LocalSearch, implement pick and register it in
+LOCAL_SEARCH, which also makes it selectable with --sls in sat.py.
+'''
+import random
+from lib import Assn
+
+
+class LocalSearch():
+    '''
+    sat:    formula to search a model of. Its input and unit clauses are used.
+    noise:  algorithm parameter, see the subclasses. None for the default.
+    seed:   seed of the random choices, for reproducible runs
+    '''
+    DEFAULT_NOISE = None
+
+    def __init__(self, sat, noise=None, seed=None):
+        self.num_vars = sat.num_vars
+        self.noise = self.DEFAULT_NOISE if noise is None else noise
+        self.rng = random.Random(seed)
+        self.clauses = [list(clause.lits) for clause in sat.clauses[:sat.num_original]]
+        self.clauses.extend([lit] for lit in sat.units)
+        # occurs[lit] is the list of indices of the clauses containing lit
+        self.occurs = [[] for _ in range(2 * self.num_vars + 2)]
+        for c, lits in enumerate(self.clauses):
+            for lit in lits:
+                self.occurs[lit].append(c)
+        self.values = bytearray([Assn.UNKNOWN]) * (2 * self.num_vars + 2)
+        self.flips = 0
+        self.tries = 0
+
+    def reset(self):
+        '''
+        Starts a new try from a random assignment, recomputing all the state
+        '''
+        values = self.values
+        rand = self.rng.random
+        for v in range(1, self.num_vars + 1):
+            value = Assn.TRUE if rand() < 0.5 else Assn.FALSE
+            values[2 * v] = value
+            values[2 * v + 1] = Assn.neg(value)
+        num_clauses = len(self.clauses)
+        self.num_true = [0] * num_clauses
+        self.true_xor = [0] * num_clauses
+        self.breaks = [0] * (self.num_vars + 1)
+        self.makes = [0] * (self.num_vars + 1)
+        self.unsat = []
+        self.unsat_pos = [-1] * num_clauses
+        for c, lits in enumerate(self.clauses):
+            for lit in lits:
+                if values[lit] == Assn.TRUE:
+                    self.num_true[c] += 1
+                    self.true_xor[c] ^= lit
+            if self.num_true[c] == 0:
+                self.unsat_pos[c] = len(self.unsat)
+                self.unsat.append(c)
+                for lit in lits:
+                    self.makes[lit >> 1] += 1
+            elif self.num_true[c] == 1:
+                self.breaks[self.true_xor[c] >> 1] += 1
+
+    def flip(self, var_):
+        '''
+        Flips var_, updating the state of the clauses it occurs in
+        '''
+        values = self.values
+        num_true = self.num_true
+        true_xor = self.true_xor
+        breaks = self.breaks
+        makes = self.makes
+        unsat = self.unsat
+        unsat_pos = self.unsat_pos
+        clauses = self.clauses
+
+        made_true = 2 * var_ if values[2 * var_] == Assn.FALSE else 2 * var_ + 1
+        made_false = made_true ^ 1
+        values[made_true] = Assn.TRUE
+        values[made_false] = Assn.FALSE
+        self.flips += 1
+
+        for c in self.occurs[made_true]:
+            num_true[c] += 1
+            if num_true[c] == 1:
+                # Newly satisfied: remove from unsat by swapping in the last one
+                last = unsat.pop()
+                if last != c:
+                    unsat[unsat_pos[c]] = last
+                    unsat_pos[last] = unsat_pos[c]
+                unsat_pos[c] = -1
+                for lit in clauses[c]:
+                    makes[lit >> 1] -= 1
+                breaks[var_] += 1
+            elif num_true[c] == 2:
+                # The previously only true literal is no longer critical
+                breaks[true_xor[c] >> 1] -= 1
+            true_xor[c] ^= made_true
+
+        for c in self.occurs[made_false]:
+            num_true[c] -= 1
+            true_xor[c] ^= made_false
+            if num_true[c] == 0:
+                unsat_pos[c] = len(unsat)
+                unsat.append(c)
+                for lit in clauses[c]:
+                    makes[lit >> 1] += 1
+                breaks[var_] -= 1
+            elif num_true[c] == 1:
+                breaks[true_xor[c] >> 1] += 1
+
+    def pick(self, lits):
+        '''
+        Returns the variable to flip among the literals of an unsatisfied clause
+        '''
+        raise NotImplementedError
+
+    def solve(self, max_flips=100000, max_tries=10):
+        '''
+        Searches for a model with up to max_tries random restarts of max_flips
+        flips each. Returns whether one was found, in which case it is in
+        values, indexed by literal as in Assignment.values.
+        '''
+        for _ in range(max_tries):
+            self.tries += 1
+            self.reset()
+            for _ in range(max_flips):
+                if not self.unsat:
+                    return True
+                c = self.unsat[self.rng.randrange(len(self.unsat))]
+                self.flip(self.pick(self.clauses[c]))
+            if not self.unsat:
+                return True
+        return False
+
+
+class WalkSAT(LocalSearch):
+    '''
+    WalkSAT/SKC: flips a variable that breaks no clause if there is one.
+    Otherwise, with probability noise it flips a random variable of the
+    clause, and else one that breaks the fewest clauses.
+    '''
+    DEFAULT_NOISE = 0.567
+
+    def pick(self, lits):
+        breaks = self.breaks
+        best, best_break = [], None
+        for lit in lits:
+            b = breaks[lit >> 1]
+            if b == 0:
+                return lit >> 1
+            if best_break is None or b < best_break:
+                best, best_break = [lit >> 1], b
+            elif b == best_break:
+                best.append(lit >> 1)
+        if self.rng.random() < self.noise:
+            return self.rng.choice(lits) >> 1
+        return self.rng.choice(best)
+
+
+class ProbSAT(LocalSearch):
+    '''
+    probSAT: picks a variable of the clause with probability proportional to
+    (EPS + break)^-noise, the polynomial break-only form that works best on
+    random 3-SAT. noise is the cb exponent.
+    '''
+    DEFAULT_NOISE = 2.38
+    EPS = 1.0
+
+    def __init__(self, sat, noise=None, seed=None):
+        super().__init__(sat, noise, seed)
+        # Weight of every possible break count
+        longest = max(map(len, self.occurs), default=0)
+        self.weights = [(self.EPS + b) ** -self.noise for b in range(longest + 1)]
+
+    def pick(self, lits):
+        breaks = self.breaks
+        weights = self.weights
+        scores = [weights[breaks[lit >> 1]] for lit in lits]
+        x = self.rng.random() * sum(scores)
+        for lit, score in zip(lits, scores):
+            x -= score
+            if x < 0:
+                return lit >> 1
+        return lits[-1] >> 1
+
+
+LOCAL_SEARCH = {
+    "walksat": WalkSAT,
+    "probsat": ProbSAT,
+}
@@ -0,0 +1,138 @@
+'''
+Search statistics and profiling hooks.
+
+A Stats object is shared by a SATSolver and its Assignment, which update its
+counters as they go. Hot loops add their counts up locally and update the
+Stats once at the end, so keeping statistics costs next to nothing.
+
+Stats can be printed as DIMACS comment lines, as competition solvers do:
+    c decisions        1234        (5678.9 /sec)
+
+For finding out where the time goes, profile() runs a function under cProfile,
+and SamplingProfiler takes periodic samples of the stack, which slows the
+solver down much less.
+'''
+import sys
+import time
+import signal
+import cProfile
+import pstats
+from collections import Counter
+
+
+class Stats():
+    '''
+    decisions:      branching decisions made
+    propagations:   literals processed by unit propagation
+    watch_visits:   clauses visited in watch lists during propagation
+    conflicts:      clauses found to have all literals false
+    backtracks:     backtracks and backjumps that undid assignments
+    max_level:      deepest decision level reached
+    restarts:       restarts made by cdcl
+    learnt:         clauses learnt by cdcl, including units
+    reductions:     clause database reductions
+    deleted:        learnt clauses deleted by them
+    '''
+    FIELDS = ["decisions", "propagations", "watch_visits", "conflicts", "backtracks",
+              "max_level", "restarts", "learnt", "reductions", "deleted"]
+    # Counters for which a rate per second is meaningful
+    RATES = {"decisions", "propagations", "watch_visits", "conflicts"}
+    __slots__ = FIELDS + ["start"]
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+        self.start = time.perf_counter()
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def as_dict(self):
+        d = {field: getattr(self, field) for field in self.FIELDS}
+        d["time"] = round(self.elapsed(), 6)
+        return d
+
+    def lines(self):
+        '''
+        Returns the statistics as DIMACS comment lines
+        '''
+        elapsed = self.elapsed()
+        lines = []
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            line = f"c {field:<16}{value:<12}"
+            if field in self.RATES and elapsed > 0:
+                line += f"({value / elapsed:.1f} /sec)"
+            lines.append(line.rstrip())
+        if self.propagations:
+            lines.append(f"c {'visits/prop':<16}{self.watch_visits / self.propagations:.2f}")
+        lines.append(f"c {'time':<16}{elapsed:.3f}s")
+        return lines
+
+    def progress_line(self):
+        '''
+        Returns a one line summary, for periodic reports during search
+        '''
+        return (f"c [{self.elapsed():8.1f}s] decisions {self.decisions} conflicts "
+                f"{self.conflicts} propagations {self.propagations} "
+                f"restarts {self.restarts} max level {self.max_level}")
+
+
+def profile(func, out=None, limit=25):
+    '''
+    Calls func under cProfile and returns its result. The profile is saved to
+    the file named out for later analysis with pstats or snakeviz, or printed
+    to stderr sorted by cumulative time if out is None.
+    '''
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        if out is None:
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(limit)
+        else:
+            profiler.dump_stats(out)
+
+
+class SamplingProfiler():
+    '''
+    Samples the call stack every interval seconds of CPU time, using SIGPROF,
+    and counts in which functions the samples land. Unix only.
+    '''
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()  # (file, line, function) -> samples on top of the stack
+        self.cumulative = Counter()  # function -> samples anywhere on the stack
+
+    def _sample(self, signum, frame):
+        self.samples[(frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)] += 1
+        seen = set()
+        while frame is not None:
+            name = frame.f_code.co_name
+            if name not in seen:
+                self.cumulative[name] += 1
+                seen.add(name)
+            frame = frame.f_back
+
+    def start(self):
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def lines(self, limit=15):
+        '''
+        Returns a report of the hottest lines and functions as DIMACS comment lines
+        '''
+        total = sum(self.samples.values()) or 1
+        lines = [f"c {sum(self.samples.values())} samples, hottest lines:"]
+        for (filename, lineno, name), count in self.samples.most_common(limit):
+            lines.append(f"c {100 * count / total:5.1f}%  {name} "
+                         f"({filename.rsplit('/', 1)[-1]}:{lineno})")
+        lines.append("c hottest functions, including callees:")
+        for name, count in self.cumulative.most_common(limit):
+            lines.append(f"c {100 * count / total:5.1f}%  {name}")
+        return lines
@@ -0,0 +1,68 @@
+'''
+Structured trace of what the solver is doing, for debugging.
+
+Every event is written as one JSON object per line, e.g.
+    {"event": "decide", "lit": -3, "level": 2}
+
+Events:
+    start:      a new formula is being solved, with its name
+    decide:     lit was chosen as the decision of a new level
+    assign:     lit was forced true, reason is the forcing clause (if any)
+    conflict:   clause has all its literals false
+    learn:      clause was learnt from the last conflict
+    backtrack:  every assignment above level was undone
+    result:     the answer, sat is true or false
+
+Literals and clauses use DIMACS numbering. The solver only calls into the
+tracer when one is attached, so tracing costs nothing when it is disabled.
+'''
+import sys
+import json
+from lib import Lit
+
+
+class Tracer():
+    '''
+    Writes trace events as JSON lines to out, a writable text file
+    '''
+
+    def __init__(self, out):
+        self.out = out
+
+    def _emit(self, event):
+        self.out.write(json.dumps(event) + "\n")
+
+    def start(self, name):
+        self._emit({"event": "start", "name": name})
+
+    def decide(self, lit, level):
+        self._emit({"event": "decide", "lit": Lit.toDimacs(lit), "level": level})
+
+    def assign(self, lit, level, reason):
+        event = {"event": "assign", "lit": Lit.toDimacs(lit), "level": level}
+        if reason is not None:
+            event["reason"] = [Lit.toDimacs(q) for q in reason.lits]
+        self._emit(event)
+
+    def conflict(self, clause, level):
+        self._emit({"event": "conflict", "clause": [Lit.toDimacs(q) for q in clause.lits],
+                    "level": level})
+
+    def learn(self, lits, level):
+        self._emit({"event": "learn", "clause": [Lit.toDimacs(q) for q in lits],
+                    "level": level})
+
+    def backtrack(self, level):
+        self._emit({"event": "backtrack", "level": level})
+
+    def result(self, sat):
+        self._emit({"event": "result", "sat": sat})
+        self.out.flush()
+
+    def close(self):
+        '''
+        Flushes the trace, and closes out unless it is stdout or stderr
+        '''
+        self.out.flush()
+        if self.out not in (sys.stdout, sys.stderr):
+            self.out.close()
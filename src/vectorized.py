@@ -0,0 +1,188 @@
+'''
+Evaluating one formula against many assignments at once with NumPy.
+
+The search itself works on one assignment at a time, incrementally, where
+watched literals beat any array code. Local search, lookahead and checking
+many models instead evaluate whole assignments from scratch, which here
+becomes a handful of array operations over all of them.
+
+Formula keeps the clauses in CSR layout: the literals of all clauses in one
+flat array, with offsets[i] the start of clause i. A batch of assignments is
+a 2D uint8 array with one row per assignment, indexed by literal like
+Assignment.values, so rows can be built with numpy.frombuffer from those
+bytearrays, or from plain booleans with Formula.values_from_bools.
+
+NumPy is optional, and only imported on first use, as importing it takes
+longer than solving a small formula. The solver uses Formula, through
+worthwhile, for large formulas when NumPy is available: to verify models in
+batch.py and bench.py, and for the initial Jeroslow-Wang and MOM scores. It
+falls back to plain loops otherwise. bench.py checks that both give the same
+results. Formula raises ImportError when NumPy is missing.
+'''
+import itertools
+from lib import Assn
+
+np = None
+# Below this many input clauses, building the arrays costs more than plain loops
+MIN_CLAUSES = 50000
+
+
+def available():
+    '''
+    Whether NumPy is installed, importing it the first time
+    '''
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+        np = numpy
+    return True
+
+
+def worthwhile(sat):
+    '''
+    Whether sat is large enough for Formula to be faster than plain loops,
+    and NumPy is available
+    '''
+    return sat.num_original >= MIN_CLAUSES and available()
+
+
+class Formula():
+    '''
+    Read-only array representation of a formula
+
+    lits:       literals of all clauses, one after the other
+    offsets:    clause i is lits[offsets[i]:offsets[i + 1]]
+    lengths:    length of every clause
+    clause_of:  index of the clause of every entry in lits
+    '''
+
+    def __init__(self, sat, learnts=False, units=True):
+        '''
+        Builds the arrays from the input clauses of sat, its unit clauses if
+        units is set, and its learnt clauses if learnts is set
+        '''
+        if not available():
+            raise ImportError("vectorized.Formula needs NumPy")
+        clauses = [clause.lits for clause in sat.clauses[:sat.num_original]]
+        if learnts:
+            clauses.extend(sat.clauses[cref].lits for cref in sat.learnts)
+        if units:
+            clauses.extend([lit] for lit in sat.units)
+        self.num_vars = sat.num_vars
+        self.num_clauses = len(clauses)
+        self.lengths = np.fromiter(map(len, clauses), dtype=np.int64, count=len(clauses))
+        self.offsets = np.zeros(len(clauses) + 1, dtype=np.int64)
+        np.cumsum(self.lengths, out=self.offsets[1:])
+        self.lits = np.fromiter(itertools.chain.from_iterable(clauses),
+                                dtype=np.int64, count=int(self.offsets[-1]))
+        self._clause_of = None
+
+    @property
+    def clause_of(self):
+        # Only built when needed, verifying models does without it
+        if self._clause_of is None:
+            self._clause_of = np.repeat(np.arange(self.num_clauses), self.lengths)
+        return self._clause_of
+
+    def values_from_bools(self, assignments):
+        '''
+        Converts a boolean array with one row per assignment and a column per
+        variable label (column 0 unused) into a batch of values
+        '''
+        assignments = np.atleast_2d(np.asarray(assignments, dtype=bool))
+        values = np.empty((assignments.shape[0], 2 * self.num_vars + 2), dtype=np.uint8)
+        values[:, 0::2] = np.where(assignments, Assn.TRUE, Assn.FALSE)
+        values[:, 1::2] = np.where(assignments, Assn.FALSE, Assn.TRUE)
+        return values
+
+    def _per_clause(self, mask):
+        '''
+        Sums a boolean array over lits, one row per assignment, per clause
+        '''
+        if self.num_clauses == 0:
+            return np.zeros((mask.shape[0], 0), dtype=np.int64)
+        # reduceat sums each [offsets[i], offsets[i + 1]) slice, none are empty
+        return np.add.reduceat(mask, self.offsets[:-1], axis=1, dtype=np.int64)
+
+    def true_counts(self, values):
+        '''
+        Returns the number of true literals of every clause under every
+        assignment, as an array of shape (assignments, clauses)
+        '''
+        values = np.atleast_2d(values)
+        return self._per_clause(values[:, self.lits] == Assn.TRUE)
+
+    def satisfied(self, values):
+        '''
+        Returns which clauses have a true literal under every assignment
+        '''
+        return self.true_counts(values) > 0
+
+    def falsified(self, values):
+        '''
+        Returns which clauses have all literals false under every assignment.
+        For full assignments these are exactly the unsatisfied clauses.
+        '''
+        values = np.atleast_2d(values)
+        return self._per_clause(values[:, self.lits] != Assn.FALSE) == 0
+
+    def count_satisfied(self, values):
+        return self.satisfied(values).sum(axis=1)
+
+    def count_falsified(self, values):
+        return self.falsified(values).sum(axis=1)
+
+    def verify(self, values):
+        '''
+        Returns which assignments satisfy every clause
+        '''
+        return self.satisfied(values).all(axis=1)
+
+    def satisfied_by(self, values):
+        '''
+        Whether a single assignment, e.g. Assignment.values, satisfies every
+        clause, like SAT.satisfied_by
+        '''
+        return bool(self.verify(np.frombuffer(values, dtype=np.uint8))[0])
+
+    def unit_clauses(self, values):
+        '''
+        Returns which clauses are unit under every assignment: no literal
+        true and exactly one unknown
+        '''
+        values = np.atleast_2d(values)
+        picked = values[:, self.lits]
+        true = self._per_clause(picked == Assn.TRUE)
+        unknown = self._per_clause(picked == Assn.UNKNOWN)
+        return (true == 0) & (unknown == 1)
+
+    def unit_literals(self, values):
+        '''
+        Returns the literals that unit clauses imply under a single assignment,
+        possibly with repeats and contradictions
+        '''
+        values = np.asarray(values)
+        unit = self.unit_clauses(values)[0]
+        open_ = (values[self.lits] == Assn.UNKNOWN) & unit[self.clause_of]
+        return self.lits[open_]
+
+    def occurrences(self, length=None):
+        '''
+        Returns the number of occurrences of every literal, only counting
+        clauses of the given length if set
+        '''
+        lits = self.lits
+        if length is not None:
+            lits = lits[self.lengths[self.clause_of] == length]
+        return np.bincount(lits, minlength=2 * self.num_vars + 2)
+
+    def jeroslow_wang(self):
+        '''
+        Returns the two-sided Jeroslow-Wang score of every variable label,
+        the sum of 2^-|C| over the clauses C it occurs in
+        '''
+        weights = np.exp2(-self.lengths[self.clause_of].astype(np.float64))
+        return np.bincount(self.lits >> 1, weights=weights, minlength=self.num_vars + 1)